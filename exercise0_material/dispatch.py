@@ -3,7 +3,7 @@ import os
 import re
 from zipfile import ZipFile
 
-exercise_files = {0: ["generator.py", "main.py", "pattern.py"],
+exercise_files = {0: ["generator.py", "main.py", "pattern.py", "preview.py"],
                   1: ["FullyConnected.py", "ReLU.py", "SoftMax.py",
                       "Loss.py", "Optimizers.py", "NeuralNetwork.py", "Base.py"],
                   2: ["FullyConnected.py", "ReLU.py", "SoftMax.py",
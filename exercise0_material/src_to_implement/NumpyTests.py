@@ -1,4 +1,6 @@
 import unittest
+import os
+import tempfile
 import numpy as np
 import tabulate
 import argparse
@@ -421,6 +423,814 @@ class TestGen(unittest.TestCase):
     #     self.assertEqual(labels, labels_pick, "Possible reason: Wrong labels are assigned to the data!")
 
 
+
+class TestGenPrefetch(unittest.TestCase):
+    def setUp(self):
+        # Set the label and the file path
+        self.label_path = 'exercise0_material/src_to_implement/data/Labels.json'
+        self.file_path = 'exercise0_material/src_to_implement/data/exercise_data'
+
+    def testSameOrder(self):
+        # Prefetching must not change which samples end up in which batch, also across the epoch boundary
+        from generator import ImageGenerator
+        gen = ImageGenerator(self.file_path, self.label_path, 30, [32, 32, 3], shuffle=False)
+        with ImageGenerator(self.file_path, self.label_path, 30, [32, 32, 3], shuffle=False,
+                            prefetch=3, num_workers=2) as gen2:
+            for _ in range(8):
+                b1 = gen.next()
+                b2 = gen2.next()
+                np.testing.assert_almost_equal(b1[0], b2[0])
+                np.testing.assert_array_equal(b1[1], b2[1])
+                self.assertEqual(gen.current_epoch(), gen2.current_epoch())
+
+    def testEpoch(self):
+        # The epoch counter follows the delivered batches, not the ones prepared ahead
+        from generator import ImageGenerator
+        with ImageGenerator(self.file_path, self.label_path, 50, [32, 32, 3], shuffle=True, prefetch=4) as gen:
+            gen.next()
+            self.assertEqual(0, gen.current_epoch())
+            gen.next()
+            self.assertEqual(0, gen.current_epoch())
+            gen.next()
+            self.assertEqual(1, gen.current_epoch())
+
+    def testShuffledEpochComplete(self):
+        # A shuffled epoch delivers every sample exactly once, also in the batch crossing the epoch boundary
+        from generator import ImageGenerator
+        for prefetch in (0, 2):
+            with ImageGenerator(None, None, 30, [8, 8, 3], shuffle=True, prefetch=prefetch, synthetic=100) as gen:
+                samples = [gen.next()[0] for _ in range(4)]
+            epoch = np.concatenate(samples)[:100].reshape(100, -1)
+            self.assertEqual(len(np.unique(epoch, axis=0)), 100)
+
+    def testBoundedQueue(self):
+        # No more than prefetch batches may be in flight at any time
+        from generator import ImageGenerator
+        with ImageGenerator(self.file_path, self.label_path, 10, [32, 32, 3], prefetch=2) as gen:
+            for _ in range(5):
+                gen.next()
+                self.assertLessEqual(len(gen._pending), 2)
+
+    def testOverlap(self):
+        # While the consumer works on a batch, the following prefetch batches are loading
+        from generator import ImageGenerator
+        with ImageGenerator(self.file_path, self.label_path, 10, [32, 32, 3], prefetch=1, buffer_count=2,
+                            dtype=np.float32) as gen:
+            for _ in range(3):
+                images, _ = gen.next()
+                returned = images.copy()
+                self.assertEqual(len(gen._pending), 1)
+                # The batch loading behind the returned one does not write into it
+                gen._pending[0][0].result()
+                np.testing.assert_array_equal(images, returned)
+
+    def testAugmentationReproducible(self):
+        # Augmentations drawn for prefetched batches do not depend on worker scheduling
+        from generator import ImageGenerator
+        batches = []
+        for _ in range(2):
+            with ImageGenerator(self.file_path, self.label_path, 20, [32, 32, 3], rotation=True, mirroring=True,
+                                shuffle=True, prefetch=2, num_workers=3) as gen:
+                batches.append(np.stack([gen.next()[0] for _ in range(6)]))
+        np.testing.assert_almost_equal(batches[0], batches[1])
+
+
+
+class TestImageCache(unittest.TestCase):
+    def setUp(self):
+        # Set the label and the file path
+        self.label_path = 'exercise0_material/src_to_implement/data/Labels.json'
+        self.file_path = 'exercise0_material/src_to_implement/data/exercise_data'
+
+    def testByteBudget(self):
+        # Both eviction policies have to keep the cache within its byte budget
+        from generator import LRUCache, ClockCache
+        for cache in (LRUCache(300), ClockCache(300)):
+            for key in range(10):
+                cache.put(key, key, 100)
+                self.assertLessEqual(cache.current_bytes, 300)
+            self.assertEqual(len(cache), 3)
+            self.assertEqual(cache.evictions, 7)
+
+    def testRecentlyUsedSurvives(self):
+        # An entry that was just read is not the next one to be evicted
+        from generator import LRUCache, ClockCache
+        for cache in (LRUCache(300), ClockCache(300)):
+            for key in range(3):
+                cache.put(key, key, 100)
+            self.assertEqual(cache.get(0), 0)
+            cache.put(3, 3, 100)
+            self.assertEqual(cache.get(0), 0)
+            self.assertIsNone(cache.get(1))
+            self.assertEqual(cache.hits, 2)
+            self.assertEqual(cache.misses, 1)
+
+    def testNoCache(self):
+        # Streaming without a cache still delivers the same batches
+        from generator import ImageGenerator
+        gen = ImageGenerator(self.file_path, self.label_path, 40, [32, 32, 3], shuffle=False)
+        gen2 = ImageGenerator(self.file_path, self.label_path, 40, [32, 32, 3], shuffle=False, cache='none')
+        for _ in range(4):
+            np.testing.assert_almost_equal(gen.next()[0], gen2.next()[0])
+        self.assertEqual(len(gen2.cache), 0)
+        self.assertEqual(gen2.cache.misses, 160)
+        self.assertEqual(gen.cache.hits, 60)
+
+
+
+class TestAugmentBatch(unittest.TestCase):
+    def setUp(self):
+        # Set the label and the file path
+        self.label_path = 'exercise0_material/src_to_implement/data/Labels.json'
+        self.file_path = 'exercise0_material/src_to_implement/data/exercise_data'
+
+    def testMatchesPerImage(self):
+        # The grouped batch augmentation has to apply exactly the flips/rotations drawn for every sample
+        from generator import ImageGenerator
+        gen = ImageGenerator(self.file_path, self.label_path, 64, [16, 16, 3], rotation=True, mirroring=True)
+        images = np.random.rand(64, 16, 16, 3)
+        augmented = gen.augment_batch(images.copy(), np.random.default_rng(3))
+
+        rng = np.random.default_rng(3)
+        mirror_types = rng.integers(0, 3, size=64)
+        ks = rng.integers(1, 4, size=64)
+        for img, aug, mirror_type, k in zip(images, augmented, mirror_types, ks):
+            if mirror_type in (0, 2):
+                img = np.fliplr(img)
+            if mirror_type in (1, 2):
+                img = np.flipud(img)
+            np.testing.assert_array_equal(np.rot90(img, k), aug)
+
+    def testAugmentLeavesOriginal(self):
+        # Augmenting a single image returns a new array
+        from generator import ImageGenerator
+        gen = ImageGenerator(self.file_path, self.label_path, 1, [16, 16, 3], rotation=True, mirroring=True)
+        img = np.random.rand(16, 16, 3)
+        original = img.copy()
+        gen.augment(img)
+        np.testing.assert_array_equal(img, original)
+
+
+
+class TestPackedDataset(unittest.TestCase):
+    def setUp(self):
+        # Set the label and the file path
+        self.label_path = 'exercise0_material/src_to_implement/data/Labels.json'
+        self.file_path = 'exercise0_material/src_to_implement/data/exercise_data'
+        self.pack_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.pack_dir.cleanup()
+
+    def testSameBatches(self):
+        # Batches from the packed dataset are identical to the ones read file by file, also when resized
+        from generator import ImageGenerator, pack_dataset
+        for image_size in ([32, 32, 3], [50, 50, 3]):
+            pack_path = pack_dataset(self.file_path, self.label_path, image_size,
+                                     os.path.join(self.pack_dir.name, str(image_size[0])))
+            gen = ImageGenerator(self.file_path, self.label_path, 30, image_size, shuffle=False)
+            gen2 = ImageGenerator(None, None, 30, image_size, shuffle=False, packed_path=pack_path)
+            for _ in range(5):
+                b1 = gen.next()
+                b2 = gen2.next()
+                np.testing.assert_almost_equal(b1[0], b2[0])
+                np.testing.assert_array_equal(b1[1], b2[1])
+
+    def testMixedDtypes(self):
+        # A resized float image is not truncated into the uint8 type of an image that already had the size
+        from generator import pack_dataset
+        file_path = os.path.join(self.pack_dir.name, 'images')
+        label_path = os.path.join(self.pack_dir.name, 'Labels.json')
+        os.makedirs(file_path)
+        np.save(os.path.join(file_path, 'a.npy'), np.full((32, 32, 3), 200, dtype=np.uint8))
+        np.save(os.path.join(file_path, 'b.npy'), np.full((40, 40, 3), 200, dtype=np.uint8))
+        with open(label_path, 'w') as f:
+            f.write('{"a": 1, "b": 2}')
+        with self.assertRaises(ValueError):
+            pack_dataset(file_path, label_path, [32, 32, 3], os.path.join(self.pack_dir.name, 'uint8'), np.uint8)
+        pack_path = pack_dataset(file_path, label_path, [32, 32, 3], os.path.join(self.pack_dir.name, 'float'),
+                                 dtype=np.float32)
+        images = np.load(os.path.join(pack_path, 'images.npy'))
+        files = list(np.load(os.path.join(pack_path, 'files.npy')))
+        self.assertEqual(images.dtype, np.float32)
+        np.testing.assert_array_equal(images[files.index('a.npy')], 200)
+        np.testing.assert_allclose(images[files.index('b.npy')], 200 / 255, rtol=1e-5)
+
+    def testShapeMismatch(self):
+        # A pack written for another image size is rejected
+        from generator import ImageGenerator, pack_dataset
+        pack_path = pack_dataset(self.file_path, self.label_path, [32, 32, 3], self.pack_dir.name)
+        with self.assertRaises(ValueError):
+            ImageGenerator(None, None, 10, [50, 50, 3], packed_path=pack_path)
+
+
+
+class TestBatchBuffers(unittest.TestCase):
+    def setUp(self):
+        # Set the label and the file path
+        self.label_path = 'exercise0_material/src_to_implement/data/Labels.json'
+        self.file_path = 'exercise0_material/src_to_implement/data/exercise_data'
+
+    def testDtype(self):
+        # Batches are delivered in the requested dtype with the same content
+        from generator import ImageGenerator
+        reference = ImageGenerator(self.file_path, self.label_path, 12, [32, 32, 3]).next()[0]
+        for dtype in (np.float16, np.float32):
+            batch = ImageGenerator(self.file_path, self.label_path, 12, [32, 32, 3], dtype=dtype).next()[0]
+            self.assertEqual(batch.dtype, dtype)
+            np.testing.assert_allclose(batch, reference, rtol=1e-3)
+
+    def testIntegerDtype(self):
+        # Float images in [0, 1] (synthetic or resized) are scaled to [0, 255] for integer batches
+        from generator import ImageGenerator
+        for args, image_size in (((None, None), [8, 8, 3]), ((self.file_path, self.label_path), [50, 50, 3])):
+            kwargs = {'synthetic': 1000} if args[0] is None else {}
+            reference = ImageGenerator(*args, 8, image_size, **kwargs).next()[0]
+            batch = ImageGenerator(*args, 8, image_size, dtype=np.uint8, **kwargs).next()[0]
+            self.assertEqual(batch.dtype, np.uint8)
+            self.assertGreater(batch.max(), 0)
+            np.testing.assert_array_equal(batch, np.rint(reference * 255))
+
+    def testRingReuse(self):
+        # With a ring of buffers the same arrays come back after buffer_count batches
+        from generator import ImageGenerator
+        gen = ImageGenerator(self.file_path, self.label_path, 10, [32, 32, 3], dtype=np.float32, buffer_count=2)
+        b1 = gen.next()
+        b2 = gen.next()
+        b3 = gen.next()
+        self.assertFalse(b1[0] is b2[0])
+        self.assertTrue(b1[0] is b3[0])
+        self.assertTrue(b1[1] is b3[1])
+
+    def testNormalize(self):
+        # The normalisation is applied while copying into the batch
+        from generator import ImageGenerator
+        reference = ImageGenerator(self.file_path, self.label_path, 12, [32, 32, 3]).next()[0]
+        batch = ImageGenerator(self.file_path, self.label_path, 12, [32, 32, 3], dtype=np.float32,
+                               normalize=([1., 2., 3.], 4.)).next()[0]
+        np.testing.assert_allclose(batch, (reference - np.array([1., 2., 3.])) / 4., rtol=1e-5, atol=1e-6)
+
+    def testInvalidSettings(self):
+        from generator import ImageGenerator
+        with self.assertRaises(ValueError):
+            ImageGenerator(self.file_path, self.label_path, 10, [32, 32, 3], dtype=np.uint8, normalize=(0., 1.))
+        with self.assertRaises(ValueError):
+            ImageGenerator(self.file_path, self.label_path, 10, [32, 32, 3], prefetch=2, buffer_count=2)
+
+
+
+class TestShardedGen(unittest.TestCase):
+    def setUp(self):
+        # Set the label and the file path
+        self.label_path = 'exercise0_material/src_to_implement/data/Labels.json'
+        self.file_path = 'exercise0_material/src_to_implement/data/exercise_data'
+
+    def testDisjointShards(self):
+        # The shards of every epoch together contain every sample, 100 samples are padded to 3 x 34
+        from generator import ImageGenerator
+        for shuffle in (False, True):
+            epochs = [[], [], []]
+            for shard_id in range(3):
+                gen = ImageGenerator(self.file_path, self.label_path, 1, [32, 32, 3], shuffle=shuffle, num_shards=3,
+                                     shard_id=shard_id, seed=7)
+                # A shard holds 34 samples, so 80 batches cover the first two epochs
+                for _ in range(80):
+                    image = gen.next()[0][0]
+                    epochs[gen.current_epoch()].append(image.tobytes())
+            for samples in epochs[:2]:
+                self.assertEqual(len(samples), 102)
+                self.assertEqual(len(set(samples)), 100)
+            if shuffle:
+                self.assertNotEqual(epochs[0], epochs[1])
+
+    def testDeterministic(self):
+        # Two workers with the same seed and shard see the same batches
+        from generator import ImageGenerator
+        gen = ImageGenerator(self.file_path, self.label_path, 15, [32, 32, 3], shuffle=True, num_shards=2,
+                             shard_id=1, seed=3)
+        gen2 = ImageGenerator(self.file_path, self.label_path, 15, [32, 32, 3], shuffle=True, num_shards=2,
+                              shard_id=1, seed=3)
+        for _ in range(6):
+            np.testing.assert_array_equal(gen.next()[0], gen2.next()[0])
+
+    def testProgress(self):
+        # Each shard holds 25 samples, so four batches of 10 are 1.6 epochs
+        from generator import ImageGenerator
+        gen = ImageGenerator(self.file_path, self.label_path, 10, [32, 32, 3], num_shards=4, shard_id=2)
+        for _ in range(4):
+            gen.next()
+        self.assertAlmostEqual(gen.epoch_progress(), 1.6)
+        self.assertEqual(gen.current_epoch(), 1)
+        with self.assertRaises(ValueError):
+            ImageGenerator(self.file_path, self.label_path, 10, [32, 32, 3], num_shards=4, shard_id=4)
+
+    def testUnevenProgress(self):
+        # 100 samples do not split into 3 shards, the shards still stay in the same epoch and agree on the progress
+        from generator import ImageGenerator
+        gens = [ImageGenerator(self.file_path, self.label_path, 10, [32, 32, 3], shuffle=True, num_shards=3,
+                               shard_id=shard_id, seed=5) for shard_id in range(3)]
+        for _ in range(40):
+            for gen in gens:
+                gen.next()
+        self.assertEqual([gen.current_epoch() for gen in gens], [11, 11, 11])
+        for gen in gens:
+            self.assertAlmostEqual(gen.epoch_progress(), 400 / 34)
+
+
+
+class TestRandomStreams(unittest.TestCase):
+    def setUp(self):
+        # Set the label and the file path
+        self.label_path = 'exercise0_material/src_to_implement/data/Labels.json'
+        self.file_path = 'exercise0_material/src_to_implement/data/exercise_data'
+
+    def testGlobalStateUntouched(self):
+        # The generator neither reads nor reseeds the global NumPy random state
+        from generator import ImageGenerator
+        np.random.seed(123)
+        expected = np.random.rand(3)
+        np.random.seed(123)
+        gen = ImageGenerator(self.file_path, self.label_path, 60, [32, 32, 3], rotation=True, mirroring=True,
+                             shuffle=True)
+        for _ in range(3):
+            gen.next()
+        np.testing.assert_array_equal(np.random.rand(3), expected)
+
+    def testIndependentOfGlobalState(self):
+        # Equal seeds give equal batches, whatever happens to the global random state
+        from generator import ImageGenerator
+        batches = []
+        for global_seed in (0, 1):
+            np.random.seed(global_seed)
+            gen = ImageGenerator(self.file_path, self.label_path, 60, [32, 32, 3], rotation=True, mirroring=True,
+                                 shuffle=True, seed=5)
+            batches.append(np.stack([gen.next()[0] for _ in range(3)]))
+        np.testing.assert_array_equal(batches[0], batches[1])
+
+        gen = ImageGenerator(self.file_path, self.label_path, 60, [32, 32, 3], rotation=True, mirroring=True,
+                             shuffle=True, seed=6)
+        self.assertFalse(np.array_equal(batches[0][0], gen.next()[0]))
+
+    def testPrefetchMatchesSerial(self):
+        # Augmentations are keyed by the batch number, so worker threads produce the serial result
+        from generator import ImageGenerator
+        gen = ImageGenerator(self.file_path, self.label_path, 30, [32, 32, 3], rotation=True, mirroring=True,
+                             shuffle=True)
+        with ImageGenerator(self.file_path, self.label_path, 30, [32, 32, 3], rotation=True, mirroring=True,
+                            shuffle=True, prefetch=3, num_workers=3) as gen2:
+            for _ in range(6):
+                np.testing.assert_array_equal(gen.next()[0], gen2.next()[0])
+
+
+
+class TestSyntheticGen(unittest.TestCase):
+
+    def testDeterministic(self):
+        # A sample always gets the same image and label, whichever batch it ends up in
+        from generator import ImageGenerator
+        gen = ImageGenerator(None, None, 16, [8, 8, 3], synthetic=1000000, shuffle=True)
+        gen2 = ImageGenerator(None, None, 16, [8, 8, 3], synthetic=1000000, shuffle=False)
+        images, labels = gen.next()
+        reference, reference_labels = gen2._assemble_batch(gen.indices[:16], None)
+        np.testing.assert_array_equal(images, reference)
+        np.testing.assert_array_equal(labels, gen.indices[:16] % 10)
+
+    def testDistinctSamples(self):
+        # Values are uniform in [0, 1) and differ between samples
+        from generator import ImageGenerator
+        images = ImageGenerator(None, None, 64, [16, 16, 3], synthetic=5000).next()[0]
+        self.assertGreaterEqual(images.min(), 0.)
+        self.assertLess(images.max(), 1.)
+        self.assertAlmostEqual(images.mean(), 0.5, places=2)
+        self.assertEqual(len(np.unique(images.reshape(64, -1), axis=0)), 64)
+
+    def testNothingCached(self):
+        from generator import ImageGenerator
+        gen = ImageGenerator(None, None, 50, [8, 8, 3], synthetic=100)
+        for _ in range(4):
+            gen.next()
+        self.assertEqual(len(gen.cache), 0)
+        self.assertEqual(gen.current_epoch(), 1)
+
+
+
+class TestDecodeStage(unittest.TestCase):
+    def setUp(self):
+        # Set the label and the file path
+        self.label_path = 'exercise0_material/src_to_implement/data/Labels.json'
+        self.file_path = 'exercise0_material/src_to_implement/data/exercise_data'
+
+    def testResizeQuality(self):
+        # Every quality resizes to the requested size, an unknown one is rejected
+        from generator import ImageGenerator
+        for quality in ('nearest', 'bilinear', 'antialias'):
+            batch = ImageGenerator(self.file_path, self.label_path, 12, [50, 50, 3], resize_quality=quality).next()[0]
+            self.assertEqual(batch.shape, (12, 50, 50, 3))
+        with self.assertRaises(ValueError):
+            ImageGenerator(self.file_path, self.label_path, 12, [50, 50, 3], resize_quality='bicubic')
+
+    def testParallelDecode(self):
+        # Decode workers deliver the same batches as decoding on the calling thread
+        from generator import ImageGenerator
+        gen = ImageGenerator(self.file_path, self.label_path, 40, [50, 50, 3], shuffle=True)
+        with ImageGenerator(self.file_path, self.label_path, 40, [50, 50, 3], shuffle=True,
+                            decode_workers=2) as gen2:
+            for _ in range(3):
+                b1 = gen.next()
+                b2 = gen2.next()
+                np.testing.assert_array_equal(b1[0], b2[0])
+                np.testing.assert_array_equal(b1[1], b2[1])
+
+    def testProcessWorkersRejected(self):
+        from generator import ImageGenerator
+        with self.assertRaises(ValueError):
+            ImageGenerator(self.file_path, self.label_path, 10, [50, 50, 3], prefetch=2, worker_type='process',
+                           num_workers=2, decode_workers=2)
+
+    def testStageTiming(self):
+        from generator import ImageGenerator
+        gen = ImageGenerator(self.file_path, self.label_path, 10, [50, 50, 3], rotation=True)
+        gen.next()
+        gen.next()
+        timing = gen.stage_timing()
+        self.assertEqual(timing['augment']['calls'], 2)
+        self.assertEqual(timing['decode']['calls'], 20)
+        self.assertEqual(timing['resize']['calls'], 20)
+        gen.reset_stage_timing()
+        self.assertEqual(gen.stage_timing()['augment']['seconds'], 0.)
+
+
+
+class TestGeneratorBenchmark(unittest.TestCase):
+
+    def testRunConfig(self):
+        # Smoke test of one benchmark configuration on synthetic data
+        import benchmark_generator
+        result = benchmark_generator.run_config({'source': 'synthetic', 'batch_size': 8, 'image_size': 16,
+                                                 'augmentation': 'both', 'shuffle': True, 'cache': 'none',
+                                                 'batches': 5, 'warmup': 1, 'samples': 1000,
+                                                 'file_path': None, 'label_path': None})
+        self.assertGreater(result['images_per_s'], 0)
+        self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+        self.assertEqual(result['stage_timing']['augment']['calls'], 6)
+        self.assertNotIn('file_path', result)
+
+
+class TestTiledPatterns(unittest.TestCase):
+    def setUp(self):
+        self.reference_dir = 'exercise0_material/src_to_implement/reference_arrays'
+
+    def testTilesMatchDraw(self):
+        # Stitching the tiles back together must reproduce draw(), also for tiles not dividing the resolution
+        import pattern
+        for p in [pattern.Checker(250, 25), pattern.Circle(1024, 200, (512, 256)), pattern.Spectrum(255)]:
+            stitched = np.zeros(p.shape(), dtype=np.float32)
+            for rows, cols, tile in p.tiles(tile_size=96):
+                self.assertLessEqual(max(tile.shape[:2]), 96)
+                stitched[rows, cols] = tile
+            np.testing.assert_array_equal(stitched, p.draw())
+        np.testing.assert_almost_equal(stitched, np.load(os.path.join(self.reference_dir, 'spectrum.npy')))
+
+    def testDrawIntoMemmap(self):
+        # Render tile by tile straight into a memory-mapped file
+        import pattern
+        c = pattern.Checker(100, 25)
+        with tempfile.TemporaryDirectory() as tmp:
+            out = np.lib.format.open_memmap(os.path.join(tmp, 'checker.npy'), mode='w+', dtype=np.float32,
+                                            shape=c.shape())
+            self.assertIs(c.draw_into(out, tile_size=30), out)
+            out.flush()
+            del out
+            np.testing.assert_array_equal(np.load(os.path.join(tmp, 'checker.npy')),
+                                          np.load(os.path.join(self.reference_dir, 'checker2.npy')))
+
+    def testDrawIntoChecksArguments(self):
+        import pattern
+        with self.assertRaises(ValueError):
+            pattern.Spectrum(64).draw_into(np.empty((64, 64), dtype=np.float32))
+        with self.assertRaises(ValueError):
+            next(pattern.Checker(100, 30).tiles())
+
+
+class TestRenderCache(unittest.TestCase):
+    def setUp(self):
+        import pattern
+        self.cache = pattern.RenderCache(max_bytes=3 * 100 * 100 * 4)
+
+    def testReadOnlyView(self):
+        # Equal parameters share one cached image, returned without copying
+        import pattern
+        a = pattern.Checker(100, 25)
+        b = pattern.Checker(100, 25)
+        a.cache = b.cache = self.cache
+        view = a.draw(copy=False)
+        self.assertIs(b.draw(copy=False), view)
+        self.assertFalse(view.flags.writeable)
+        with self.assertRaises(ValueError):
+            view[0, 0] = 1
+        self.assertEqual(self.cache.stats()['hits'], 1)
+        np.testing.assert_array_equal(view, np.load('exercise0_material/src_to_implement/reference_arrays/checker2.npy'))
+
+    def testPrivateCopy(self):
+        # The default draw() keeps a writable image of its own and leaves the cache alone
+        import pattern
+        a = pattern.Checker(100, 25)
+        b = pattern.Checker(100, 25)
+        a.cache = b.cache = self.cache
+        a.draw()
+        b.draw()
+        self.assertIsNot(a.output, b.output)
+        a.output[0, 0] = 1
+        self.assertEqual(len(self.cache), 0)
+
+    def testKeyedByParameters(self):
+        import pattern
+        circles = [pattern.Circle(100, 20, (50, 50)), pattern.Circle(100, 20, (50, 40)),
+                   pattern.Circle(100, 10, (50, 50)), pattern.Circle(100, 20, 50)]
+        for c in circles:
+            c.cache = self.cache
+            c.draw(copy=False)
+        self.assertEqual(self.cache.stats()['misses'], 3)
+        self.assertEqual(self.cache.stats()['hits'], 1)
+        self.assertIs(circles[0].output, circles[3].output)
+        self.assertNotEqual(circles[0].cache_key(), pattern.Spectrum(100).cache_key())
+
+    def testEviction(self):
+        # The cache holds three 100x100 float32 images, the least recently used one is dropped
+        import pattern
+        for tile_size in (10, 25, 50, 10, 5):
+            c = pattern.Checker(100, tile_size)
+            c.cache = self.cache
+            c.draw(copy=False)
+        self.assertEqual(len(self.cache), 3)
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+        self.assertNotIn(pattern.Checker(100, 25).cache_key(), self.cache)
+        self.assertIn(pattern.Checker(100, 10).cache_key(), self.cache)
+        self.assertLessEqual(self.cache.nbytes, self.cache.max_bytes)
+
+
+class TestBatchedPatterns(unittest.TestCase):
+
+    def testCircleBatch(self):
+        # The batch must match drawing each circle on its own, independent of the chunk size
+        import pattern
+        rng = np.random.default_rng(0)
+        positions = rng.uniform(0, 64, size=(10, 2))
+        radii = rng.uniform(1, 30, size=10)
+        expected = np.stack([pattern.Circle(64, r, tuple(p)).draw_into() for r, p in zip(radii, positions)])
+        np.testing.assert_array_equal(pattern.Circle.batch(64, radii, positions), expected)
+        np.testing.assert_array_equal(pattern.Circle.batch(64, radii, positions, chunk_size=3), expected)
+        np.testing.assert_array_equal(pattern.Circle.batch(64, 20, [10, 32])[1], pattern.Circle(64, 20, 32).draw())
+
+    def testCheckerBatch(self):
+        import pattern
+        boards = pattern.Checker.batch(100, [25, 10, 50, 25], chunk_size=3)
+        self.assertEqual(boards.shape, (4, 100, 100))
+        np.testing.assert_array_equal(boards[0], np.load('exercise0_material/src_to_implement/reference_arrays/checker2.npy'))
+        np.testing.assert_array_equal(boards[1], pattern.Checker(100, 10).draw())
+        with self.assertRaises(ValueError):
+            pattern.Checker.batch(100, [25, 30])
+
+    def testPackbits(self):
+        import pattern
+        masks = pattern.Circle.batch(61, [5, 20, 40], [(0, 0), (30, 30), (61, 10)])
+        packed = pattern.Circle.batch(61, [5, 20, 40], [(0, 0), (30, 30), (61, 10)], chunk_size=2, packbits=True)
+        self.assertEqual(packed.shape, (3, 61, 8))
+        self.assertEqual(packed.dtype, np.uint8)
+        np.testing.assert_array_equal(np.unpackbits(packed, axis=-1, count=61), masks)
+
+
+class TestCompactPatterns(unittest.TestCase):
+
+    def testDtypes(self):
+        # Every output type holds the same 0/1 image
+        import pattern
+        reference = np.load('exercise0_material/src_to_implement/reference_arrays/checker.npy')
+        for dtype in (bool, np.uint8, np.float16, np.float32):
+            c = pattern.Checker(250, 25, dtype=dtype)
+            res = c.draw()
+            self.assertEqual(res.dtype, dtype)
+            np.testing.assert_array_equal(res, reference)
+            self.assertEqual(pattern.Circle.batch(32, [4, 8], [3, 20], dtype=dtype).dtype, dtype)
+        with self.assertRaises(ValueError):
+            pattern.Circle(100, 20, 50, dtype=np.int64)
+
+    def testDrawPacked(self):
+        import pattern
+        for p in (pattern.Circle(1000, 321.5, (400, 700)), pattern.Checker(96, 3)):
+            packed = p.draw_packed(rows_per_tile=7)
+            self.assertEqual(packed.shape, (p.resolution, (p.resolution + 7) // 8))
+            np.testing.assert_array_equal(pattern.unpack_bits(packed, p.resolution), p.draw())
+            np.testing.assert_array_equal(pattern.pack_bits(p.draw()), packed)
+        with self.assertRaises(ValueError):
+            pattern.Spectrum(16).draw_packed()
+
+    def testUnpackBits(self):
+        import pattern
+        masks = pattern.Circle.batch(50, [10, 20, 30], [(25, 25), (0, 10), (40, 50)], dtype=bool)
+        packed = pattern.pack_bits(masks)
+        self.assertEqual(packed.nbytes, 3 * 50 * 7)
+        unpacked = pattern.unpack_bits(packed[1:], 50, dtype=bool)
+        self.assertEqual(unpacked.dtype, bool)
+        np.testing.assert_array_equal(unpacked, masks[1:])
+        np.testing.assert_array_equal(pattern.unpack_bits(packed, 50, dtype=np.float16), masks)
+
+
+class TestAntialiasedCircle(unittest.TestCase):
+
+    def testCoverage(self):
+        # Coverage must agree with heavy supersampling and sum up to the area of the circle
+        import pattern
+        c = pattern.Circle(64, 20.3, (30.2, 25.7), antialias=True)
+        coverage = c.draw()
+        offsets = (np.arange(16) + 0.5) / 16 - 0.5
+        yy, xx = np.mgrid[0:64, 0:64]
+        supersampled = np.mean([(xx + ox - 30.2)**2 + (yy + oy - 25.7)**2 <= 20.3**2
+                                for oy in offsets for ox in offsets], axis=0)
+        np.testing.assert_allclose(coverage, supersampled, atol=0.02)
+        self.assertAlmostEqual(float(coverage.sum(dtype=np.float64)), np.pi * 20.3**2, places=2)
+        self.assertEqual(coverage.min(), 0.)
+        self.assertEqual(coverage.max(), 1.)
+
+    def testTiledAndClipped(self):
+        # Circles crossing the image border, rendered tile by tile
+        import pattern
+        for radius, position in [(40, (0, 10)), (0.3, (5, 5)), (100, 32)]:
+            c = pattern.Circle(64, radius, position, antialias=True)
+            np.testing.assert_array_equal(c.draw_into(tile_size=13), c.draw_into())
+        self.assertAlmostEqual(float(pattern.Circle(10, 0.3, 5, antialias=True).draw().sum()), np.pi * 0.09, places=6)
+
+    def testArguments(self):
+        import pattern
+        with self.assertRaises(ValueError):
+            pattern.Circle(64, 10, 32, dtype=bool, antialias=True)
+        with self.assertRaises(ValueError):
+            pattern.Circle(64, 10, 32, antialias=True).draw_packed()
+        self.assertNotEqual(pattern.Circle(64, 10, 32, antialias=True).cache_key(), pattern.Circle(64, 10, 32).cache_key())
+
+
+class TestPatternExpressions(unittest.TestCase):
+
+    def testComposite(self):
+        # A lazy expression must give the same image as the eager computation on full arrays
+        import pattern
+        checker = pattern.Checker(100, 10)
+        circle = pattern.Circle(100, 30, (50, 40), antialias=True)
+        spectrum = pattern.Spectrum(100)
+        expression = circle.mask(spectrum, checker.colourize((1, 0, 0), (0, 0, 1))) * 0.5 + 0.25
+
+        background = np.float32([1, 0, 0]) + checker.draw()[..., None] * np.float32([-1, 0, 1])
+        expected = (background + circle.draw()[..., None] * (spectrum.draw() - background)) * 0.5 + 0.25
+        np.testing.assert_allclose(expression.draw(), expected, atol=1e-6)
+        np.testing.assert_array_equal(expression.draw_into(tile_size=17), expression.draw())
+        self.assertEqual(expression.shape(), (100, 100, 3))
+
+    def testOperands(self):
+        import pattern
+        checker = pattern.Checker(64, 8, dtype=bool)
+        circle = pattern.Circle(64, 20, 32, dtype=np.uint8)
+        # Binary operands are combined as numbers, constants may stand on either side
+        np.testing.assert_array_equal((checker + circle).draw(), checker.draw().astype(np.float32) + circle.draw())
+        tinted = np.array([1, 0.5, 0]) * circle
+        self.assertIsInstance(tinted, pattern.Multiply)
+        np.testing.assert_array_equal(tinted.draw()[32, 32], [1, 0.5, 0])
+        self.assertNotEqual((2 * circle).cache_key(), (3 * circle).cache_key())
+        with self.assertRaises(ValueError):
+            checker + pattern.Circle(32, 10, 16)
+        with self.assertRaises(ValueError):
+            pattern.Spectrum(64).colourize()
+
+    def testTiledEvaluation(self):
+        # Rendering never evaluates the operands on more than one tile at a time
+        import pattern
+        shapes = []
+
+        class Probe(pattern.Checker):
+            def _render(self, out, rows, cols):
+                shapes.append(out.shape)
+                super()._render(out, rows, cols)
+
+        expression = Probe(1024, 8) * pattern.Spectrum(1024) + 1
+        expression.draw_into()
+        self.assertEqual(len(shapes), 16)
+        self.assertEqual(max(shapes), (expression.render_tile_size, expression.render_tile_size))
+
+
+class TestGradientSpectrum(unittest.TestCase):
+
+    def testChannelViews(self):
+        # Channels that change along one axis only are zero-stride views of a 1-D ramp
+        import pattern
+        s = pattern.Spectrum(100)
+        image = s.draw()
+        for c in range(3):
+            channel = s.channel(c)
+            self.assertIn(0, channel.strides)
+            self.assertFalse(channel.flags.writeable)
+            np.testing.assert_array_equal(channel, image[..., c])
+        np.testing.assert_almost_equal(image, np.load('exercise0_material/src_to_implement/reference_arrays/spectrum2.npy'))
+
+    def testSharedRamps(self):
+        import pattern
+        a, b = pattern.Spectrum(64), pattern.Spectrum(64)
+        self.assertIs(a.ramps()[0], b.ramps()[0])
+        self.assertEqual(pattern.Spectrum(65).ramps()[0].shape, (65, 3))
+
+    def testGradientStops(self):
+        import pattern
+        s = pattern.Spectrum(11, horizontal=[(0, (0, 0, 0)), (0.5, (1, 0, 0)), (1, (1, 1, 0))],
+                             vertical=[(0, 0, 0), (0, 0, 1)])
+        image = s.draw()
+        np.testing.assert_allclose(image[0, :, 0], [0, .2, .4, .6, .8, 1, 1, 1, 1, 1, 1], atol=1e-6)
+        np.testing.assert_allclose(image[:, 0, 2], np.linspace(0, 1, 11), atol=1e-6)
+        # Mixed channels are materialised on demand
+        np.testing.assert_array_equal(pattern.Spectrum(11, vertical=[(0, 0, 0), (1, 0, 0)]).channel(0)[:, 3],
+                                      np.linspace(0, 1, 11, dtype=np.float32)[3] + np.linspace(0, 1, 11, dtype=np.float32))
+        with self.assertRaises(ValueError):
+            pattern.Spectrum(11, horizontal=[(1, (0, 0, 0)), (0, (1, 1, 1))])
+
+    def testHSV(self):
+        # A hue ramp at full saturation and value
+        import pattern
+        s = pattern.Spectrum(7, horizontal=[(0, 1, 1), (1, 1, 1)], vertical=[(0, 0, 0), (0, 0, 0)], colour_space='hsv')
+        np.testing.assert_allclose(s.draw()[3, [0, 2, 4]], [[1, 0, 0], [0, 1, 0], [0, 0, 1]], atol=1e-6)
+
+
+class TestPatternBenchmark(unittest.TestCase):
+
+    def testReferences(self):
+        # All renderers must reproduce the reference arrays bit for bit
+        import benchmark_pattern
+        self.assertEqual(benchmark_pattern.check_references(), [])
+
+    def testRunCase(self):
+        import benchmark_pattern
+        for mode in benchmark_pattern.MODES:
+            result = benchmark_pattern.run_case(mode, 64, repeats=2)
+            self.assertGreater(result['ns_per_pixel'], 0)
+            self.assertGreaterEqual(result['ns_per_pixel'], result['best_ns_per_pixel'])
+            self.assertGreater(result['peak_mb'], 0)
+
+    def testRegressionGate(self):
+        import benchmark_pattern
+        baseline = {'results': [{'mode': 'circle', 'resolution': 64, 'ns_per_pixel': 2.0},
+                                {'mode': 'spectrum', 'resolution': 64, 'ns_per_pixel': 2.0}]}
+        results = [{'mode': 'circle', 'resolution': 64, 'ns_per_pixel': 2.4},
+                   {'mode': 'spectrum', 'resolution': 64, 'ns_per_pixel': 3.0},
+                   {'mode': 'checker', 'resolution': 64, 'ns_per_pixel': 9.0}]
+        self.assertEqual(benchmark_pattern.compare_baseline(results, baseline, 0.25), [('spectrum@64', 1.5)])
+        self.assertEqual(len(benchmark_pattern.compare_baseline(results, baseline, 0.1)), 2)
+
+
+class TestHeadlessPreview(unittest.TestCase):
+    def setUp(self):
+        self.label_path = 'exercise0_material/src_to_implement/data/Labels.json'
+        self.file_path = 'exercise0_material/src_to_implement/data/exercise_data'
+
+    def testPatternPNG(self):
+        # The PNG holds the pattern pixel for pixel
+        import pattern
+        import matplotlib.image
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'checker.png')
+            self.assertEqual(pattern.Checker(100, 25).show(path), path)
+            np.testing.assert_array_equal(matplotlib.image.imread(path)[..., 0], pattern.Checker(100, 25).draw())
+            future = pattern.Spectrum(64).show(os.path.join(tmp, 'spectrum.png'), background=True)
+            self.assertTrue(os.path.exists(future.result(timeout=30)))
+            # Writing the PNG leaves the pattern's own output writable
+            c = pattern.Checker(100, 25)
+            c.draw()
+            c.show(os.path.join(tmp, 'checker2.png'))
+            self.assertTrue(c.output.flags.writeable)
+            c.output[0, 0] = 5
+
+    def testPeekDoesNotAdvance(self):
+        # Peeking across an epoch boundary with shuffling must not change the batches next() returns
+        from generator import ImageGenerator
+        for prefetch in (0, 2):
+            gen = ImageGenerator(self.file_path, self.label_path, 7, [16, 16, 3], rotation=True, mirroring=True,
+                                 shuffle=True, prefetch=prefetch, seed=3, cache='none')
+            reference = ImageGenerator(self.file_path, self.label_path, 7, [16, 16, 3], rotation=True,
+                                       mirroring=True, shuffle=True, seed=3, cache='none')
+            for _ in range(20):
+                peeked = gen.peek()
+                images, labels = gen.next()
+                np.testing.assert_array_equal(peeked[0], images)
+                np.testing.assert_array_equal(peeked[1], labels)
+                np.testing.assert_array_equal(reference.next()[0], images)
+            gen.close()
+
+    def testContactSheetInBackground(self):
+        from generator import ImageGenerator
+        gen = ImageGenerator(self.file_path, self.label_path, 12, [32, 32, 3], seed=1)
+        epoch, index = gen.current_epoch(), gen.index
+        with tempfile.TemporaryDirectory() as tmp:
+            future = gen.show(os.path.join(tmp, 'batch.png'), background=True)
+            path = future.result(timeout=60)
+            self.assertGreater(os.path.getsize(path), 0)
+        self.assertEqual((gen.current_epoch(), gen.index), (epoch, index))
+
+
 if __name__ == '__main__':
 
     import sys
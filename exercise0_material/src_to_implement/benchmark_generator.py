@@ -0,0 +1,187 @@
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+import numpy as np
+import tabulate
+
+from generator import ImageGenerator
+
+# Location of the bundled data, relative to this file
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_ZIP = os.path.join(SRC_DIR, 'data.zip')
+TEST_DATA = os.path.join(SRC_DIR, 'test_data.npy')
+
+# Augmentation settings of the sweep: name -> (rotation, mirroring)
+AUGMENTATIONS = {'none': (False, False), 'mirror': (False, True), 'rotate': (True, False), 'both': (True, True)}
+
+
+def prepare_data(data_dir, extract_dir):
+    """Return (file_path, label_path) of the bundled data set, extracting data.zip into extract_dir if it is not
+    unpacked in data_dir (None: the data directory next to this file) yet"""
+    if data_dir is None:
+        data_dir = os.path.join(SRC_DIR, 'data')
+    if not os.path.isdir(os.path.join(data_dir, 'exercise_data')):
+        data_dir = extract_dir
+        with zipfile.ZipFile(DATA_ZIP) as archive:
+            archive.extractall(data_dir)
+    return os.path.join(data_dir, 'exercise_data'), os.path.join(data_dir, 'Labels.json')
+
+
+def check_data(file_path, label_path):
+    """Compare sample count and label histogram of the bundled data with test_data.npy (image means and labels)"""
+    test_means, test_labels = np.load(TEST_DATA)
+    gen = ImageGenerator(file_path, label_path, len(test_means), [32, 32, 3], cache='none')
+    labels = gen.next()[1]
+    if gen.num_samples != len(test_means) or not np.array_equal(np.bincount(labels, minlength=10),
+                                                                np.bincount(test_labels.astype(int), minlength=10)):
+        print(f"Warning: The data in {file_path} does not match {TEST_DATA}.")
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MiB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+
+def run_config(config):
+    """Time config['batches'] calls of next() after config['warmup'] untimed ones"""
+    size = config['image_size']
+    rotation, mirroring = AUGMENTATIONS[config['augmentation']]
+    if config['source'] == 'synthetic':
+        gen = ImageGenerator(None, None, config['batch_size'], [size, size, 3], rotation, mirroring,
+                             config['shuffle'], cache=config['cache'], synthetic=config['samples'])
+    else:
+        gen = ImageGenerator(config['file_path'], config['label_path'], config['batch_size'], [size, size, 3],
+                             rotation, mirroring, config['shuffle'], cache=config['cache'])
+
+    for _ in range(config['warmup']):
+        gen.next()
+    latencies = np.zeros(config['batches'])
+    for i in range(config['batches']):
+        start = time.perf_counter()
+        gen.next()
+        latencies[i] = time.perf_counter() - start
+    gen.close()
+
+    result = {key: value for key, value in config.items() if key not in ('file_path', 'label_path')}
+    result.update({
+        'images_per_s': config['batch_size'] * config['batches'] / latencies.sum(),
+        'p50_ms': 1000 * np.percentile(latencies, 50),
+        'p99_ms': 1000 * np.percentile(latencies, 99),
+        'peak_rss_mb': peak_rss_mb(),
+        'stage_timing': gen.stage_timing(),
+    })
+    return result
+
+
+def config_key(result):
+    """Identify a configuration across runs"""
+    return (result['source'], result['batch_size'], result['image_size'], result['augmentation'], result['shuffle'],
+            result['cache'])
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=SRC_DIR, stderr=subprocess.DEVNULL,
+                                       text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def build_configs(args, file_path, label_path):
+    configs = []
+    for source, batch_size, image_size, augmentation, shuffle, cache in itertools.product(
+            args.sources, args.batch_sizes, args.image_sizes, args.augmentations, args.shuffle, args.caches):
+        configs.append({'source': source, 'batch_size': batch_size, 'image_size': image_size,
+                        'augmentation': augmentation, 'shuffle': shuffle, 'cache': cache,
+                        'batches': args.batches, 'warmup': args.warmup, 'samples': args.samples,
+                        'file_path': file_path, 'label_path': label_path})
+    return configs
+
+
+def run_all(configs, isolate=True):
+    """Run every configuration, each in a fresh process by default so that the peak RSS belongs to it alone"""
+    if not isolate:
+        return [run_config(config) for config in configs]
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(1, maxtasksperchild=1) as pool:
+        return pool.map(run_config, configs, chunksize=1)
+
+
+def print_results(results, baseline=None):
+    headers = ['source', 'batch', 'size', 'augment', 'shuffle', 'cache', 'images/s', 'p50 ms', 'p99 ms', 'RSS MiB']
+    if baseline is not None:
+        headers.append('speedup')
+        baseline = {config_key(result): result for result in baseline['results']}
+    table = []
+    for r in results:
+        row = [r['source'], r['batch_size'], r['image_size'], r['augmentation'], r['shuffle'], r['cache'],
+               f"{r['images_per_s']:.0f}", f"{r['p50_ms']:.2f}", f"{r['p99_ms']:.2f}", f"{r['peak_rss_mb']:.0f}"]
+        if baseline is not None:
+            old = baseline.get(config_key(r))
+            row.append(f"{r['images_per_s'] / old['images_per_s']:.2f}x" if old else '-')
+        table.append(row)
+    print(tabulate.tabulate(table, headers=headers, tablefmt="github"))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Measure the throughput of ImageGenerator.next() over a grid of "
+                                                 "settings and save the results as JSON.")
+    parser.add_argument('--sources', nargs='+', default=['synthetic', 'files'], choices=['synthetic', 'files'])
+    parser.add_argument('--batch-sizes', nargs='+', type=int, default=[32, 256])
+    parser.add_argument('--image-sizes', nargs='+', type=int, default=[32, 64])
+    parser.add_argument('--augmentations', nargs='+', default=['none', 'both'], choices=list(AUGMENTATIONS))
+    parser.add_argument('--shuffle', nargs='+', type=lambda s: s.lower() in ('1', 'true', 'yes'),
+                        default=[False, True], help="shuffle settings to sweep, e.g. --shuffle false true")
+    parser.add_argument('--caches', nargs='+', default=['lru', 'none'], choices=['lru', 'clock', 'none'])
+    parser.add_argument('--batches', type=int, default=20, help="timed batches per configuration")
+    parser.add_argument('--warmup', type=int, default=3, help="untimed batches before timing")
+    parser.add_argument('--samples', type=int, default=100000, help="size of the synthetic data set")
+    parser.add_argument('--data-dir', default=None, help="unpacked data.zip (extracted to a temporary "
+                                                         "directory when missing)")
+    parser.add_argument('--output', default='generator_benchmark.json')
+    parser.add_argument('--compare', default=None, help="earlier result file to compute speedups against")
+    parser.add_argument('--no-isolate', action='store_true', help="run all configurations in this process")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # An extracted copy of data.zip only lives as long as the benchmark
+    with tempfile.TemporaryDirectory(prefix='generator_benchmark_') as extract_dir:
+        file_path = label_path = None
+        if 'files' in args.sources:
+            file_path, label_path = prepare_data(args.data_dir, extract_dir)
+            check_data(file_path, label_path)
+
+        results = run_all(build_configs(args, file_path, label_path), isolate=not args.no_isolate)
+
+    report = {
+        'meta': {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'git_revision': git_revision(),
+                 'python': platform.python_version(), 'numpy': np.__version__, 'platform': platform.platform(),
+                 'cpus': os.cpu_count()},
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    baseline = None
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
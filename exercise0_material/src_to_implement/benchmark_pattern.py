@@ -0,0 +1,170 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+import numpy as np
+import tabulate
+
+import pattern
+from benchmark_generator import git_revision
+
+# Location of the reference images, relative to this file
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+REFERENCE_DIR = os.path.join(SRC_DIR, 'reference_arrays')
+
+# Reference image -> pattern producing it (the configurations of NumpyTests)
+REFERENCES = {
+    'checker.npy': lambda: pattern.Checker(250, 25),
+    'checker2.npy': lambda: pattern.Checker(100, 25),
+    'circle.npy': lambda: pattern.Circle(1024, 200, (512, 256)),
+    'circle2.npy': lambda: pattern.Circle(512, 20, (50, 50)),
+    'spectrum.npy': lambda: pattern.Spectrum(255),
+    'spectrum2.npy': lambda: pattern.Spectrum(100),
+}
+
+# Number of circles of the batched mode
+BATCH_SIZE = 16
+
+
+def _circle(res, **kwargs):
+    return pattern.Circle(res, res // 3, (res // 2, res // 3), **kwargs)
+
+
+# Rendering modes of the sweep: name -> function(resolution) returning (render function, rendered pixels)
+MODES = {
+    'checker': lambda res: (lambda: pattern.Checker(res, res // 16).draw_into(), res * res),
+    'checker-tiled': lambda res: (lambda: pattern.Checker(res, res // 16).draw_into(tile_size=256), res * res),
+    'checker-packed': lambda res: (lambda: pattern.Checker(res, res // 16).draw_packed(), res * res),
+    'circle': lambda res: (lambda: _circle(res).draw_into(), res * res),
+    'circle-tiled': lambda res: (lambda: _circle(res).draw_into(tile_size=256), res * res),
+    'circle-bool': lambda res: (lambda: _circle(res, dtype=bool).draw_into(), res * res),
+    'circle-packed': lambda res: (lambda: _circle(res).draw_packed(), res * res),
+    'circle-antialias': lambda res: (lambda: _circle(res, antialias=True).draw_into(), res * res),
+    'circle-batch': lambda res: (lambda: pattern.Circle.batch(res, np.linspace(res / 8, res / 2, BATCH_SIZE),
+                                                              np.full((BATCH_SIZE, 2), res / 2)),
+                                 BATCH_SIZE * res * res),
+    'spectrum': lambda res: (lambda: pattern.Spectrum(res).draw_into(), res * res),
+    'spectrum-tiled': lambda res: (lambda: pattern.Spectrum(res).draw_into(tile_size=256), res * res),
+    'composite': lambda res: (lambda: _circle(res, antialias=True).mask(pattern.Spectrum(res),
+                                                                        pattern.Checker(res, res // 16)).draw_into(),
+                              res * res),
+}
+
+
+def check_references():
+    """Render every reference configuration, also tiled and bit-packed, and return the mismatching ones"""
+    failures = []
+    for name, make in REFERENCES.items():
+        # References are stored in various types, compare in the type of the rendered image
+        p = make()
+        expected = np.load(os.path.join(REFERENCE_DIR, name)).astype(p.dtype)
+        renders = {'draw': p.draw_into(), 'tiled': p.draw_into(tile_size=96)}
+        if p._is_binary():
+            renders['packed'] = pattern.unpack_bits(p.draw_packed(), p.resolution, p.dtype)
+        for mode, image in renders.items():
+            if not np.array_equal(image, expected):
+                failures.append(f"{name} ({mode})")
+    return failures
+
+
+def run_case(mode, resolution, repeats):
+    """Time repeats renders of one mode and measure the peak of the memory allocated while rendering"""
+    render, pixels = MODES[mode](resolution)
+    render()
+    times = np.zeros(repeats)
+    for i in range(repeats):
+        start = time.perf_counter()
+        render()
+        times[i] = time.perf_counter() - start
+
+    tracemalloc.start()
+    render()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'mode': mode, 'resolution': resolution, 'pixels': pixels, 'ns_per_pixel': 1e9 * np.median(times) / pixels,
+            'best_ns_per_pixel': 1e9 * times.min() / pixels, 'peak_mb': peak / 2**20}
+
+
+def case_key(result):
+    """Identify a case across runs"""
+    return f"{result['mode']}@{result['resolution']}"
+
+
+def compare_baseline(results, baseline, threshold):
+    """Return (key, slowdown) of all cases slower than the baseline by more than the fraction threshold"""
+    baseline = {case_key(result): result for result in baseline['results']}
+    regressions = []
+    for r in results:
+        old = baseline.get(case_key(r))
+        if old is not None and r['ns_per_pixel'] > old['ns_per_pixel'] * (1 + threshold):
+            regressions.append((case_key(r), r['ns_per_pixel'] / old['ns_per_pixel']))
+    return regressions
+
+
+def print_results(results, baseline=None):
+    headers = ['mode', 'resolution', 'ns/pixel', 'best ns/pixel', 'peak MiB']
+    if baseline is not None:
+        headers.append('vs baseline')
+        baseline = {case_key(result): result for result in baseline['results']}
+    table = []
+    for r in results:
+        row = [r['mode'], r['resolution'], f"{r['ns_per_pixel']:.3f}", f"{r['best_ns_per_pixel']:.3f}",
+               f"{r['peak_mb']:.1f}"]
+        if baseline is not None:
+            old = baseline.get(case_key(r))
+            row.append(f"{r['ns_per_pixel'] / old['ns_per_pixel']:.2f}x" if old else '-')
+        table.append(row)
+    print(tabulate.tabulate(table, headers=headers, tablefmt="github"))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Time the pattern renderers, check them against the reference "
+                                                 "arrays and compare the timings with a stored baseline.")
+    parser.add_argument('--modes', nargs='+', default=list(MODES), choices=list(MODES))
+    parser.add_argument('--resolutions', nargs='+', type=int, default=[256, 1024, 4096],
+                        help="image sizes, multiples of 16")
+    parser.add_argument('--repeats', type=int, default=5, help="timed renders per case")
+    parser.add_argument('--output', default='pattern_benchmark.json')
+    parser.add_argument('--baseline', default=None, help="earlier result file to compare against")
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help="allowed slowdown against the baseline as a fraction (0.25 = 25%% slower)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Run the benchmark, return 1 if a reference does not match or a case regressed and 0 otherwise"""
+    args = parse_args(argv)
+    failures = check_references()
+    for failure in failures:
+        print(f"Error: {failure} does not match the reference array.")
+
+    # The render cache would turn repeated draws into lookups, draw_into() always renders
+    results = [run_case(mode, res, args.repeats) for mode in args.modes for res in args.resolutions]
+
+    report = {
+        'meta': {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'git_revision': git_revision(),
+                 'python': platform.python_version(), 'numpy': np.__version__, 'platform': platform.platform()},
+        'references_ok': not failures,
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    baseline = None
+    regressions = []
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare_baseline(results, baseline, args.threshold)
+    print_results(results, baseline)
+    for key, slowdown in regressions:
+        print(f"Error: {key} is {slowdown:.2f}x slower than the baseline (threshold {1 + args.threshold:.2f}x).")
+    print(f"Results written to {args.output}")
+    return 1 if failures or regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
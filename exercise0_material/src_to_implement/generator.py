@@ -1,22 +1,435 @@
 import os.path
 import json
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 import numpy as np
 import matplotlib.pyplot as plt
 from PIL import Image
 
+from preview import save_contact_sheet, submit_preview
+
+# Generator copy owned by a prefetch worker process (set by _init_worker)
+_WORKER_GENERATOR = None
+
+# Ids of the independent random streams every ImageGenerator derives from its seed
+_SHUFFLE_STREAM = 0
+_AUGMENT_STREAM = 1
+_SYNTH_STREAM = 2
+
+# Constants of the SplitMix64 finalizer used to hash synthetic pixels
+_GOLDEN_GAMMA = np.uint64(0x9E3779B97F4A7C15)
+_MIX_1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX_2 = np.uint64(0x94D049BB133111EB)
+# Bit pattern of the double 1.0
+_ONE_BITS = np.uint64(0x3FF0000000000000)
+# Number of values hashed per chunk, small enough to stay in cache
+_SYNTH_CHUNK = 1 << 15
+
+
+def _init_worker(generator):
+    """Install the generator copy used by this worker process"""
+    global _WORKER_GENERATOR
+    _WORKER_GENERATOR = generator
+
+
+def _resize_skimage(img, output_shape, quality):
+    """Resize with scikit-image, which is imported once and then kept in _BACKEND_MODULES"""
+    resize = _BACKEND_MODULES.get('skimage')
+    if resize is None:
+        from skimage.transform import resize
+        _BACKEND_MODULES['skimage'] = resize
+    order, anti_aliasing = _SKIMAGE_QUALITY[quality]
+    return resize(img, output_shape, order=order, anti_aliasing=anti_aliasing)
+
+
+# Imported backend functions, so the import does not run per image
+_BACKEND_MODULES = {}
+
+# Interpolation order and anti-aliasing of every resize quality in scikit-image
+_SKIMAGE_QUALITY = {'nearest': (0, False), 'bilinear': (1, False), 'antialias': (1, True)}
+
+# Resize backends by name. A backend is a function (img, (height, width), quality) -> resized image,
+# a custom one can be passed directly (as a module level function, so that process workers can use it)
+RESIZE_BACKENDS = {'skimage': _resize_skimage}
+
+
+def load_image(image_path, image_size, resize_quality='antialias', resize_backend='skimage'):
+    """Decode one image file and resize it to image_size.
+    Returns the image and the seconds spent decoding and resizing."""
+    start = time.perf_counter()
+    if image_path.endswith('.npy'):
+        img = np.load(image_path)
+    else:
+        img = np.array(Image.open(image_path))
+    decoded = time.perf_counter()
+
+    # Resize if needed
+    if img.shape[0] != image_size[0] or img.shape[1] != image_size[1]:
+        if not callable(resize_backend):
+            resize_backend = RESIZE_BACKENDS[resize_backend]
+        img = resize_backend(img, (image_size[0], image_size[1]), resize_quality)
+
+    # Ensure image has correct number of channels
+    if len(img.shape) == 2:
+        img = np.stack([img, img, img], axis=2)
+    resized = time.perf_counter()
+
+    return img, decoded - start, resized - decoded
+
+
+def _load_image_or_none(image_path, image_size, resize_quality, resize_backend):
+    """load_image for the decode workers, failures are handled by the caller"""
+    try:
+        return load_image(image_path, image_size, resize_quality, resize_backend)
+    except Exception:
+        return None
+
+
+def _assemble_in_worker(batch_indices, batch_number):
+    """Assemble one batch inside a worker process"""
+    return _WORKER_GENERATOR._assemble_batch(batch_indices, _WORKER_GENERATOR._rng(_AUGMENT_STREAM, batch_number))
+
+
+class ImageCache:
+    """Base class of the image caches. Used on its own it is the "no cache" mode: nothing is kept."""
+
+    def __init__(self, max_bytes=0):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # Locks cannot be pickled, worker processes get a fresh one
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return 0
+
+    def __contains__(self, key):
+        return False
+
+    def get(self, key):
+        """Return the cached value for key or None"""
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, value, nbytes):
+        """Store value under key, it accounts for nbytes of the budget"""
+        pass
+
+    def clear(self):
+        """Drop all entries, the counters are kept"""
+        pass
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'entries': len(self),
+                'bytes': self.current_bytes, 'max_bytes': self.max_bytes}
+
+
+class LRUCache(ImageCache):
+    """Byte budget cache evicting the least recently used entry first"""
+
+    def __init__(self, max_bytes):
+        super().__init__(max_bytes)
+        # key -> (value, nbytes), ordered from least to most recently used
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        # Membership test without touching the counters or the eviction order
+        return key in self._entries
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, nbytes):
+        # Entries larger than the whole budget are never cached
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                return
+            while self.current_bytes + nbytes > self.max_bytes:
+                _, (_, evicted_bytes) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_bytes
+                self.evictions += 1
+            self._entries[key] = (value, nbytes)
+            self.current_bytes += nbytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+
+class ClockCache(ImageCache):
+    """Byte budget cache with CLOCK (second chance) eviction, hits only set a reference bit"""
+
+    def __init__(self, max_bytes):
+        super().__init__(max_bytes)
+        # key -> [value, nbytes, referenced, slot]
+        self._entries = {}
+        # Ring of keys swept by the clock hand, evicted slots are None and reused
+        self._ring = []
+        self._free_slots = []
+        self._hand = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        # Membership test without touching the counters or the eviction order
+        return key in self._entries
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            entry[2] = True
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, nbytes):
+        # Entries larger than the whole budget are never cached
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                return
+            while self.current_bytes + nbytes > self.max_bytes:
+                self._evict_one()
+            if self._free_slots:
+                slot = self._free_slots.pop()
+                self._ring[slot] = key
+            else:
+                slot = len(self._ring)
+                self._ring.append(key)
+            self._entries[key] = [value, nbytes, False, slot]
+            self.current_bytes += nbytes
+
+    def _evict_one(self):
+        """Advance the hand until an unreferenced entry is found and evict it"""
+        while True:
+            key = self._ring[self._hand]
+            slot = self._hand
+            self._hand = (self._hand + 1) % len(self._ring)
+            if key is None:
+                continue
+            entry = self._entries[key]
+            if entry[2]:
+                # Second chance
+                entry[2] = False
+                continue
+            del self._entries[key]
+            self._ring[slot] = None
+            self._free_slots.append(slot)
+            self.current_bytes -= entry[1]
+            self.evictions += 1
+            return
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._ring = []
+            self._free_slots = []
+            self._hand = 0
+            self.current_bytes = 0
+
+
+def make_cache(cache, max_bytes):
+    """Create the cache selected by name ('lru', 'clock' or 'none') or return the given cache instance"""
+    if isinstance(cache, ImageCache):
+        return cache
+    if cache is None or cache == 'none':
+        return ImageCache()
+    if cache == 'lru':
+        return LRUCache(max_bytes)
+    if cache == 'clock':
+        return ClockCache(max_bytes)
+    raise ValueError("cache must be 'lru', 'clock', 'none' or an ImageCache instance")
+
+
 class ImageGenerator:
-    def __init__(self, file_path, label_path, batch_size, image_size, rotation=False, mirroring=False, shuffle=False):
+    def __init__(self, file_path, label_path, batch_size, image_size, rotation=False, mirroring=False, shuffle=False,
+                 prefetch=0, num_workers=1, worker_type='thread', cache='lru', cache_bytes=512 * 2 ** 20,
+                 packed_path=None, dtype=np.float64, buffer_count=0, normalize=None, num_shards=1, shard_id=0,
+                 seed=None, synthetic=None, resize_quality='antialias', resize_backend='skimage', decode_workers=0):
         self.batch_size = batch_size
         self.image_size = image_size
         self.rotation = rotation
         self.mirroring = mirroring
         self.shuffle = shuffle
+
+        # Number of batches prepared ahead of the consumer (0 disables prefetching)
+        if worker_type not in ('thread', 'process'):
+            raise ValueError("worker_type must be 'thread' or 'process'")
+        self.prefetch = prefetch
+        self.num_workers = num_workers
+        self.worker_type = worker_type
+
+        # Decoding and resizing of image files, optionally spread over decode_workers processes
+        if resize_quality not in _SKIMAGE_QUALITY:
+            raise ValueError("resize_quality must be 'nearest', 'bilinear' or 'antialias'")
+        if not callable(resize_backend) and resize_backend not in RESIZE_BACKENDS:
+            raise ValueError(f"Unknown resize backend {resize_backend}")
+        self.resize_quality = resize_quality
+        self.resize_backend = resize_backend
+        # Process workers would each start a decode pool of their own that nothing shuts down
+        if decode_workers and worker_type == 'process':
+            raise ValueError("decode_workers cannot be used with process workers")
+        self.decode_workers = decode_workers
+        # Created on first use, the lock keeps prefetch and preview threads from creating a pool each
+        self._decode_executor = None
+        self._decode_lock = threading.Lock()
+
+        # Seconds spent and calls made per pipeline stage, see stage_timing()
+        self._stage_seconds = {'decode': 0.0, 'resize': 0.0, 'augment': 0.0}
+        self._stage_calls = {'decode': 0, 'resize': 0, 'augment': 0}
+        self._timing_lock = threading.Lock()
+
+        # Output dtype of the image batches and the optional (mean, std) normalisation applied while copying
+        self.dtype = np.dtype(dtype)
+        # Float images (resized or synthetic) lie in [0, 1], they are scaled to [0, 255] for integer batches
+        self._float_to_int = np.issubdtype(self.dtype, np.integer)
+        self.normalize = normalize
+        self._norm_scale = None
+        self._norm_offset = None
+        if normalize is not None:
+            if not np.issubdtype(self.dtype, np.floating):
+                raise ValueError("normalize requires a floating point dtype")
+            mean, std = normalize
+            self._norm_scale = 1.0 / np.asarray(std, dtype=np.float64)
+            self._norm_offset = -np.asarray(mean, dtype=np.float64) * self._norm_scale
+
+        # Ring of preallocated batch buffers (0 allocates a new batch per call). A returned batch is
+        # overwritten buffer_count batches later, so consumers must be done with it by then. With prefetching
+        # the returned batch and the prefetch batches loading behind it each need their own buffer
+        if buffer_count and worker_type == 'process':
+            raise ValueError("buffer_count cannot be used with process workers")
+        if buffer_count and buffer_count < prefetch + 1:
+            raise ValueError("buffer_count must be at least prefetch + 1")
+        self.buffer_count = buffer_count
+        self._buffers = [self._allocate_batch() for _ in range(buffer_count)]
+        self._next_buffer = 0
         
-        # Set a fixed seed for reproducibility when not shuffling
-        self._random_seed = 42
-        if not self.shuffle:
-            np.random.seed(self._random_seed)
+        # Split every epoch into num_shards disjoint parts, this generator only delivers part shard_id
+        if not 0 <= shard_id < num_shards:
+            raise ValueError("shard_id must be in [0, num_shards)")
+        self.num_shards = num_shards
+        self.shard_id = shard_id
+
+        # Every generator owns its random streams for shuffling, augmentation and synthetic images, all
+        # derived from one seed and independent of the global NumPy state. All shards of one dataset
+        # have to share the seed, since the epoch permutations are derived from it
+        self._random_seed = 42 if seed is None else seed
+        self._shuffle_rng = self._rng(_SHUFFLE_STREAM)
+        self._augment_rng = self._rng(_AUGMENT_STREAM)
+        self._batch_count = 0
         
+        # A packed dataset (see pack_dataset) or a synthetic dataset of the given number of samples
+        # replaces the label file and the image directory
+        if packed_path is not None and synthetic is not None:
+            raise ValueError("packed_path and synthetic cannot be combined")
+        self.file_path = file_path
+        self.packed_path = packed_path
+        self.synthetic = synthetic
+        self._packed_images = None
+        self._synth_key = self._rng(_SYNTH_STREAM).integers(0, 2 ** 63, dtype=np.uint64)
+        if synthetic is not None:
+            self.labels = {}
+            self.files = []
+        elif packed_path is not None:
+            self._open_packed()
+            self.labels = {}
+            self.files = [str(f) for f in np.load(os.path.join(packed_path, 'files.npy'))]
+            if self._packed_images.shape[1:] != tuple(self.image_size):
+                raise ValueError(f"Packed images have shape {self._packed_images.shape[1:]}, "
+                                 f"expected {tuple(self.image_size)}")
+        else:
+            self._load_files(label_path)
+        if self.synthetic is not None:
+            self.num_samples = self.synthetic
+        elif self._packed_images is not None:
+            self.num_samples = len(self._packed_images)
+        else:
+            self.num_samples = len(self.files)
+
+        # Initialize index and epoch counters. The index and the planned epoch belong to the
+        # batch planner, which runs ahead of the consumer when prefetching is enabled
+        self.index = 0
+        self._current_epoch = 0
+        self._current_index = 0
+        self._planned_epoch = 0
+        
+        # Keep track of original data order for non-shuffled access
+        self.original_indices = np.arange(self.num_samples)
+        
+        # Shuffle data if needed
+        if self.num_shards > 1:
+            self.indices = self._shard_indices(0)
+        else:
+            self.indices = np.copy(self.original_indices)
+            if self.shuffle:
+                self._shuffle_rng.shuffle(self.indices)
+            
+        # Store images and labels for consistent access, bounded by a byte budget.
+        # Process workers each fill their own copy of the cache
+        self.cache = make_cache(cache, cache_bytes)
+        
+        # Class dictionary
+        self.class_dict = {0: 'airplane', 1: 'automobile', 2: 'bird', 3: 'cat', 4: 'deer', 5: 'dog', 6: 'frog',
+                          7: 'horse', 8: 'ship', 9: 'truck'}
+
+        # Worker pool and bounded queue of in-flight batches, created lazily on the first next()
+        self._executor = None
+        self._pending = deque()
+
+    def __getstate__(self):
+        # Worker processes get a copy without the pool and the in-flight batches.
+        # The packed memory map is opened again instead of being pickled as a whole
+        state = self.__dict__.copy()
+        state['_executor'] = None
+        state['_decode_executor'] = None
+        state['_pending'] = deque()
+        del state['_timing_lock']
+        del state['_decode_lock']
+        if self._packed_images is not None:
+            state['_packed_images'] = None
+            state['_packed_labels'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._timing_lock = threading.Lock()
+        self._decode_lock = threading.Lock()
+        if self.packed_path is not None:
+            self._open_packed()
+
+    def _load_files(self, label_path):
+        """Read the label file and list the image files of file_path"""
         # Load labels from JSON file, handle file not found
         try:
             with open(label_path, 'r') as f:
@@ -24,106 +437,197 @@ class ImageGenerator:
         except FileNotFoundError:
             print(f"Warning: Label file {label_path} not found. Using empty labels.")
             self.labels = {}
-            
+        
         # Get all image files, handle directory not found
-        self.file_path = file_path
         try:
-            self.files = os.listdir(file_path)
+            self.files = os.listdir(self.file_path)
             self.files = [f for f in self.files if f.endswith('.npy') or f.endswith('.png') or f.endswith('.jpg')]
         except FileNotFoundError:
-            print(f"Warning: Directory {file_path} not found. Using empty file list.")
+            print(f"Warning: Directory {self.file_path} not found. Using empty file list.")
             self.files = []
         
-        # If no files found, create a dummy file list for testing with deterministic data
+        # If no files found, fall back to 100 synthetic samples for testing with deterministic data
         if not self.files:
-            print("No files found. Creating dummy data for testing.")
-            self.files = [f"dummy_{i}.npy" for i in range(100)]  # Always create 100 dummy files
-        
-        # Initialize index and epoch counters
-        self.index = 0
-        self._current_epoch = 0
-        
-        # Keep track of original data order for non-shuffled access
-        self.original_indices = np.arange(len(self.files))
-        
-        # Shuffle data if needed
-        self.indices = np.copy(self.original_indices)
-        if self.shuffle:
-            np.random.shuffle(self.indices)
-            
-        # Store images and labels for consistent access
-        self._cached_images = {}
-        
-        # Class dictionary
-        self.class_dict = {0: 'airplane', 1: 'automobile', 2: 'bird', 3: 'cat', 4: 'deer', 5: 'dog', 6: 'frog',
-                          7: 'horse', 8: 'ship', 9: 'truck'}
+            print("No files found. Creating synthetic data for testing.")
+            self.synthetic = 100
+
+    def _open_packed(self):
+        """Map the packed images and load the packed labels"""
+        self._packed_images = np.load(os.path.join(self.packed_path, 'images.npy'), mmap_mode='r')
+        self._packed_labels = np.load(os.path.join(self.packed_path, 'labels.npy'))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Shut down the prefetch and decode workers and drop all batches that were prepared ahead"""
+        if self._executor is not None:
+            for future, *_ in self._pending:
+                future.cancel()
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        self._pending.clear()
+        with self._decode_lock:
+            if self._decode_executor is not None:
+                self._decode_executor.shutdown(wait=True)
+                self._decode_executor = None
+
+    def _record(self, stage, seconds, calls=1):
+        """Add the time spent in one pipeline stage"""
+        with self._timing_lock:
+            self._stage_seconds[stage] += seconds
+            self._stage_calls[stage] += calls
+
+    def stage_timing(self):
+        """Seconds spent, number of calls and mean milliseconds per call of the decode, resize and augment
+        stages. Decode and resize count images, augment counts batches. Work done in prefetch worker
+        processes is not included, work of the decode workers is."""
+        with self._timing_lock:
+            return {stage: {'seconds': seconds, 'calls': self._stage_calls[stage],
+                            'mean_ms': 1000 * seconds / max(self._stage_calls[stage], 1)}
+                    for stage, seconds in self._stage_seconds.items()}
+
+    def reset_stage_timing(self):
+        with self._timing_lock:
+            for stage in self._stage_seconds:
+                self._stage_seconds[stage] = 0.0
+                self._stage_calls[stage] = 0
 
     def _get_image(self, file_idx):
         """Get image by index with caching for consistency"""
+        # Packed images are already resized and need no cache, synthetic ones are recomputed
+        if self._packed_images is not None:
+            return self._packed_images[file_idx], int(self._packed_labels[file_idx])
+        if self.synthetic is not None:
+            return self._synthesize([file_idx])[0], file_idx % 10
+
         file = self.files[file_idx]
         
         # Return from cache if already loaded
-        if file_idx in self._cached_images:
-            return self._cached_images[file_idx]
+        cached = self.cache.get(file_idx)
+        if cached is not None:
+            return cached
         
-        # For dummy files or when file doesn't exist, generate a deterministic random image
-        if file.startswith('dummy_') or not os.path.exists(os.path.join(self.file_path, file)):
-            # Set seed based on index for reproducibility
-            np.random.seed(self._random_seed + file_idx)
-            img = np.random.rand(self.image_size[0], self.image_size[1], self.image_size[2])
+        # When the file doesn't exist, generate a deterministic synthetic image
+        if not os.path.exists(os.path.join(self.file_path, file)):
+            img = self._synthesize([file_idx])[0]
             label = file_idx % 10  # Deterministic label based on index
-            
-            # Reset random state
-            if not self.shuffle:
-                np.random.seed(self._random_seed)
         else:
             # Load real image
             image_path = os.path.join(self.file_path, file)
             try:
-                if file.endswith('.npy'):
-                    img = np.load(image_path)
-                else:
-                    img = np.array(Image.open(image_path))
-                    
-                # Resize if needed
-                if img.shape[0] != self.image_size[0] or img.shape[1] != self.image_size[1]:
-                    from skimage.transform import resize
-                    img = resize(img, (self.image_size[0], self.image_size[1]), anti_aliasing=True)
-                    
-                # Ensure image has correct number of channels
-                if len(img.shape) == 2:
-                    img = np.stack([img, img, img], axis=2)
+                img, decode_seconds, resize_seconds = load_image(image_path, self.image_size, self.resize_quality,
+                                                                 self.resize_backend)
+                self._record('decode', decode_seconds)
+                self._record('resize', resize_seconds)
                 
                 # Get label
                 label = self.labels.get(file.split('.')[0], 0)
             except Exception:
                 # Use deterministic random image as fallback
-                np.random.seed(self._random_seed + file_idx)
-                img = np.random.rand(self.image_size[0], self.image_size[1], self.image_size[2])
+                img = self._synthesize([file_idx])[0]
                 label = file_idx % 10
-                if not self.shuffle:
-                    np.random.seed(self._random_seed)
         
         # Cache the result
-        self._cached_images[file_idx] = (img.copy(), label)
+        self.cache.put(file_idx, (img.copy(), label), img.nbytes)
         return img, label
 
+    def _decode_parallel(self, batch_indices):
+        """Decode and resize the images of a batch that are not cached yet on the decode worker processes.
+        Returns file index -> (image, label) for every image that was loaded successfully."""
+        missing = [file_idx for file_idx in dict.fromkeys(batch_indices.tolist()) if file_idx not in self.cache]
+        if not missing:
+            return {}
+        with self._decode_lock:
+            if self._decode_executor is None:
+                self._decode_executor = ProcessPoolExecutor(self.decode_workers)
+            executor = self._decode_executor
+
+        paths = [os.path.join(self.file_path, self.files[file_idx]) for file_idx in missing]
+        n = len(paths)
+        results = executor.map(_load_image_or_none, paths, [self.image_size] * n,
+                               [self.resize_quality] * n, [self.resize_backend] * n,
+                               chunksize=max(1, n // (4 * self.decode_workers)))
+
+        decoded = {}
+        for file_idx, result in zip(missing, results):
+            # Failed images are left to _get_image, which falls back to synthetic data
+            if result is None:
+                continue
+            img, decode_seconds, resize_seconds = result
+            self._record('decode', decode_seconds)
+            self._record('resize', resize_seconds)
+            label = self.labels.get(self.files[file_idx].split('.')[0], 0)
+            self.cache.put(file_idx, (img.copy(), label), img.nbytes)
+            decoded[file_idx] = (img, label)
+        return decoded
+
     def next(self):
+        if self.prefetch > 0:
+            return self._next_prefetched()
+
+        batch_indices = self._plan_batch()
+        self._current_epoch = self._planned_epoch
+        self._current_index = self.index
+        return self._assemble_batch(batch_indices, self._rng(_AUGMENT_STREAM, self._batch_count),
+                                    self._take_buffer())
+
+    def _next_prefetched(self):
+        """Return the oldest prepared batch and keep the queue filled with the following ones"""
+        if self._executor is None:
+            if self.worker_type == 'process':
+                self._executor = ProcessPoolExecutor(self.num_workers, initializer=_init_worker,
+                                                     initargs=(self,))
+            else:
+                self._executor = ThreadPoolExecutor(self.num_workers)
+
+        # Take the oldest batch first and refill the queue before waiting for it, so that prefetch batches
+        # load while the consumer works on the returned one
+        if not self._pending:
+            self._submit_batch()
+        future, self._current_epoch, self._current_index, _, _ = self._pending.popleft()
+        while len(self._pending) < self.prefetch:
+            self._submit_batch()
+        return future.result()
+
+    def _submit_batch(self):
+        """Plan the next batch and queue its loading on the worker pool"""
+        # Batches are planned in order on the calling thread, so only the loading runs in the workers
+        batch_indices = self._plan_batch()
+        # Augmentations come from a stream keyed by the batch number, so they do not depend on worker scheduling
+        if self.worker_type == 'process':
+            future = self._executor.submit(_assemble_in_worker, batch_indices, self._batch_count)
+        else:
+            # The buffer is picked at planning time, the ring size keeps it away from the batch the consumer
+            # holds and the prefetch batches in flight
+            future = self._executor.submit(self._assemble_batch, batch_indices,
+                                           self._rng(_AUGMENT_STREAM, self._batch_count), self._take_buffer())
+        self._pending.append((future, self._planned_epoch, self.index, batch_indices, self._batch_count))
+
+    def _plan_batch(self):
+        """Advance the cursor by one batch and return the file indices of that batch"""
+        self._batch_count += 1
+
         # Calculate remaining samples in current epoch
-        remaining = len(self.files) - self.index
+        remaining = len(self.indices) - self.index
         
         # Check if we need to start a new epoch
         if remaining < self.batch_size:
-            # Get current batch indices
-            current_indices = self.indices[self.index:self.index + remaining]
+            # Get current batch indices (copied, since the next shuffle works in place)
+            current_indices = self.indices[self.index:self.index + remaining].copy()
             
             # Reset index and increment epoch
             self.index = 0
-            self._current_epoch += 1
+            self._planned_epoch += 1
             
             # Shuffle for next epoch if needed
-            if self.shuffle:
-                np.random.shuffle(self.indices)
+            if self.num_shards > 1:
+                self.indices = self._shard_indices(self._planned_epoch)
+            elif self.shuffle:
+                self._shuffle_rng.shuffle(self.indices)
                 
             # Get rest of the batch from the next epoch
             next_indices = self.indices[:self.batch_size - remaining]
@@ -132,66 +636,282 @@ class ImageGenerator:
             # Update index
             self.index = self.batch_size - remaining
         else:
-            # Get current batch indices
-            batch_indices = self.indices[self.index:self.index + self.batch_size]
+            # Get current batch indices (copied, since the next shuffle works in place)
+            batch_indices = self.indices[self.index:self.index + self.batch_size].copy()
             self.index += self.batch_size
-        
+
+        return batch_indices
+
+    def _peek_plan(self):
+        """Return the file indices and the batch number of the batch the next call of next() returns,
+        without moving the cursor"""
+        if self._pending:
+            return self._pending[0][3], self._pending[0][4]
+        state = (self.index, self._planned_epoch, self._batch_count, self.indices.copy(),
+                 self._shuffle_rng.bit_generator.state)
+        try:
+            batch_indices = self._plan_batch()
+            return batch_indices, self._batch_count
+        finally:
+            (self.index, self._planned_epoch, self._batch_count, self.indices,
+             self._shuffle_rng.bit_generator.state) = state
+
+    def peek(self):
+        """Return a copy of the batch the next call of next() returns, including its augmentations,
+        without advancing the generator"""
+        batch_indices, batch_number = self._peek_plan()
+        return self._assemble_batch(batch_indices, self._rng(_AUGMENT_STREAM, batch_number))
+
+    def _rng(self, stream, *key):
+        """Return a random generator for the given stream, optionally keyed (e.g. by index or batch number).
+        Equal seed, stream and key always give the same sequence."""
+        return np.random.default_rng(np.random.SeedSequence(self._random_seed, spawn_key=(stream,) + key))
+
+    def _shard_indices(self, epoch):
+        """Return this shard's part of the given epoch. Every shard derives the same epoch permutation
+        from the shared seed, so the parts of all shards together cover the epoch. All parts have the
+        same length, so the shards stay in the same epoch: when the samples do not split evenly, the
+        permutation is padded with its first samples, which then appear twice in that epoch."""
+        if self.shuffle:
+            order = self._rng(_SHUFFLE_STREAM, epoch).permutation(self.num_samples)
+        else:
+            order = self.original_indices
+        padding = -self.num_samples % self.num_shards
+        if padding:
+            order = np.concatenate([order, order[:padding]])
+        # Strided split
+        return order[self.shard_id::self.num_shards].copy()
+
+    def _allocate_batch(self):
+        """Allocate image and label arrays for one batch"""
+        images = np.empty((self.batch_size, self.image_size[0], self.image_size[1], self.image_size[2]),
+                          dtype=self.dtype)
+        labels = np.empty(self.batch_size, dtype=np.int32)
+        return images, labels
+
+    def _take_buffer(self):
+        """Return the next buffer of the ring, or None when buffers are not reused"""
+        if not self._buffers:
+            return None
+        buffer = self._buffers[self._next_buffer]
+        self._next_buffer = (self._next_buffer + 1) % len(self._buffers)
+        return buffer
+
+    def _store(self, out, img):
+        """Copy img into out, casting to the batch dtype and normalising or scaling to [0, 255] on the way"""
+        if self._float_to_int and np.issubdtype(img.dtype, np.floating):
+            np.copyto(out, np.rint(img * 255), casting='unsafe')
+        elif self._norm_scale is None:
+            np.copyto(out, img, casting='unsafe')
+        else:
+            np.multiply(img, self._norm_scale, out=out, casting='unsafe')
+            out += self._norm_offset
+
+    def _assemble_batch(self, batch_indices, rng, buffer=None):
+        """Load and augment the images of one batch into buffer, drawing augmentations from rng"""
         # Initialize batch arrays
-        images = np.zeros((self.batch_size, self.image_size[0], self.image_size[1], self.image_size[2]))
-        labels = np.zeros(self.batch_size, dtype=np.int32)
+        if buffer is None:
+            buffer = self._allocate_batch()
+        images, labels = buffer
         
-        # Load and process each image
-        for i, idx in enumerate(batch_indices):
-            # Get file index from indices array
-            file_idx = idx
-            
-            # Get image and label
-            img, label = self._get_image(file_idx)
-            
-            # Apply augmentations
+        # Packed datasets are gathered straight from the memory map
+        if self._packed_images is not None:
+            if self._norm_scale is None and images.dtype == self._packed_images.dtype:
+                # Indices are always valid, 'clip' avoids the extra buffering of mode='raise'
+                np.take(self._packed_images, batch_indices, axis=0, out=images, mode='clip')
+            else:
+                for i, file_idx in enumerate(batch_indices):
+                    self._store(images[i], self._packed_images[file_idx])
+            np.take(self._packed_labels, batch_indices, out=labels, mode='clip')
             if self.rotation or self.mirroring:
-                img = self.augment(img.copy())
-            
-            # Store in batch
-            images[i] = img
+                self.augment_batch(images, rng)
+            return images, labels
+
+        # Synthetic batches are computed in one pass, labels follow from the sample index
+        if self.synthetic is not None:
+            if self._norm_scale is None and not self._float_to_int:
+                self._synthesize(batch_indices, out=images)
+            else:
+                self._store(images, self._synthesize(batch_indices))
+            np.remainder(batch_indices, 10, out=labels, casting='unsafe')
+            if self.rotation or self.mirroring:
+                self.augment_batch(images, rng)
+            return images, labels
+
+        # Decode and resize the missing images in parallel first if requested
+        decoded = self._decode_parallel(batch_indices) if self.decode_workers else {}
+
+        # Load each image straight into the batch
+        for i, file_idx in enumerate(batch_indices):
+            if file_idx in decoded:
+                img, label = decoded[file_idx]
+            else:
+                img, label = self._get_image(file_idx)
+            self._store(images[i], img)
             labels[i] = label
+
+        # Apply augmentations to the whole batch at once
+        if self.rotation or self.mirroring:
+            self.augment_batch(images, rng)
         
         return images, labels
 
-    def augment(self, img):
-        # Create a copy to avoid modifying the original
-        img_augmented = img.copy()
-        
-        # Apply random mirroring
+    def _synthesize(self, sample_indices, out=None):
+        """Return synthetic images in [0, 1) for the given sample indices, computed in vectorized passes.
+        Every value is a SplitMix64 hash of (seed, sample index, position), so nothing has to be stored.
+        The hashing runs in cache sized chunks and writes the result straight into out when given."""
+        shape = tuple(self.image_size[:3])
+        pixels = int(np.prod(shape))
+        n = len(sample_indices)
+        if out is None:
+            out = np.empty((n,) + shape)
+        flat_out = out.reshape(n, pixels)
+
+        # One counter per value: sample index * pixels + position
+        base = np.asarray(sample_indices, dtype=np.uint64) * np.uint64(pixels)
+        positions = np.arange(pixels, dtype=np.uint64)
+
+        rows = max(1, _SYNTH_CHUNK // pixels)
+        z = np.empty(rows * pixels, dtype=np.uint64)
+        shifted = np.empty_like(z)
+        for start in range(0, n, rows):
+            stop = min(n, start + rows)
+            size = (stop - start) * pixels
+            zc = z[:size]
+            sc = shifted[:size]
+            np.add(base[start:stop, np.newaxis], positions, out=zc.reshape(stop - start, pixels))
+
+            # SplitMix64, mixed in place
+            zc += self._synth_key
+            zc *= _GOLDEN_GAMMA
+            np.right_shift(zc, np.uint64(30), out=sc)
+            zc ^= sc
+            zc *= _MIX_1
+            np.right_shift(zc, np.uint64(27), out=sc)
+            zc ^= sc
+            zc *= _MIX_2
+            np.right_shift(zc, np.uint64(31), out=sc)
+            zc ^= sc
+
+            # The top 52 bits become the mantissa of a double in [1, 2), shifted to [0, 1) on the way out
+            zc >>= np.uint64(12)
+            zc |= _ONE_BITS
+            np.subtract(zc.view(np.float64).reshape(stop - start, pixels), 1.0, out=flat_out[start:stop],
+                        casting='unsafe')
+        return out
+
+    def augment(self, img, rng=None):
+        """Augment a single image, the original is left untouched"""
+        return self.augment_batch(img[np.newaxis].copy(), rng)[0]
+
+    def augment_batch(self, images, rng=None):
+        """Augment a (N, H, W, C) batch in place and return it.
+        There are only a few flip/rotation combinations, so all samples sharing one are transformed together."""
+        start = time.perf_counter()
+
+        # Draw from the generator's augmentation stream unless a batch specific stream is given
+        if rng is None:
+            rng = self._augment_rng
+        n = images.shape[0]
+
+        # Random mirroring: 0: horizontal, 1: vertical, 2: both, -1: none
         if self.mirroring:
-            mirror_type = np.random.randint(0, 3)  # 0: horizontal, 1: vertical, 2: both
-            
+            mirror_types = rng.integers(0, 3, size=n)
+        else:
+            mirror_types = np.full(n, -1)
+
+        # Random rotation: 1=90°, 2=180°, 3=270°, 0: none
+        if self.rotation:
+            ks = rng.integers(1, 4, size=n)
+        else:
+            ks = np.zeros(n, dtype=int)
+
+        # Group the samples by their combined transform
+        codes = (mirror_types + 1) * 4 + ks
+        for code in np.unique(codes):
+            mirror_type, k = code // 4 - 1, code % 4
+            if mirror_type == -1 and k == 0:
+                continue
+            selection = np.flatnonzero(codes == code)
+            group = images[selection]
+
             if mirror_type == 0 or mirror_type == 2:
-                img_augmented = np.fliplr(img_augmented)  # Horizontal flip
-            
+                group = group[:, :, ::-1]  # Horizontal flip
+
             if mirror_type == 1 or mirror_type == 2:
-                img_augmented = np.flipud(img_augmented)  # Vertical flip
-        
-        # Apply random rotation
-        if self.rotation:
-            k = np.random.randint(1, 4)  # 1=90°, 2=180°, 3=270°
-            img_augmented = np.rot90(img_augmented, k)
-                
-        return img_augmented
+                group = group[:, ::-1]  # Vertical flip
+
+            if k:
+                group = np.rot90(group, k, axes=(1, 2))
+
+            images[selection] = group
+
+        self._record('augment', time.perf_counter() - start)
+        return images
 
     def current_epoch(self):
         return self._current_epoch
 
+    def epoch_progress(self):
+        """Number of epochs delivered so far as a float, e.g. 2.25 after a quarter of the third epoch.
+        All shards have parts of equal length and advance in lockstep, so this is also the progress of
+        the global epoch."""
+        return self._current_epoch + self._current_index / len(self.indices)
+
     def class_name(self, x):
         return self.class_dict.get(x, f"Unknown class {x}")
     
-    def show(self):
-        images, labels = self.next()
-        fig, axes = plt.subplots(2, 5, figsize=(15, 6))
-        axes = axes.flatten()
-        for i in range(min(10, self.batch_size)):
-            axes[i].imshow(images[i])
-            axes[i].set_title(self.class_name(labels[i]))
-            axes[i].axis('off')
-        plt.tight_layout()
-        plt.show()
\ No newline at end of file
+    def show(self, path=None, background=False):
+        """Show the first images of the upcoming batch without consuming it. With path, write them as a PNG
+        contact sheet without any GUI instead, on the preview thread if background is set (returns a Future)."""
+        if path is None:
+            images, labels = self.peek()
+            fig, axes = plt.subplots(2, 5, figsize=(15, 6))
+            axes = axes.flatten()
+            for i in range(min(10, self.batch_size)):
+                axes[i].imshow(images[i])
+                axes[i].set_title(self.class_name(labels[i]))
+                axes[i].axis('off')
+            plt.tight_layout()
+            plt.show()
+            return None
+
+        # Only the planning happens here, loading and drawing the batch are left to the preview thread
+        batch_indices, batch_number = self._peek_plan()
+        if background:
+            return submit_preview(self._write_preview, batch_indices, batch_number, path)
+        return self._write_preview(batch_indices, batch_number, path)
+
+    def _write_preview(self, batch_indices, batch_number, path):
+        """Load the given batch into fresh arrays and write its first images to a contact sheet"""
+        images, labels = self._assemble_batch(batch_indices, self._rng(_AUGMENT_STREAM, batch_number))
+        count = min(10, self.batch_size)
+        return save_contact_sheet(images[:count], path, [self.class_name(label) for label in labels[:count]])
+
+
+def pack_dataset(file_path, label_path, image_size, pack_path, dtype=None):
+    """One-time conversion of an image directory into a packed dataset for ImageGenerator(packed_path=...).
+    Writes images.npy (all images resized to image_size in one contiguous array), labels.npy and files.npy.
+    dtype is the stored image type, by default the type of the first image. An image that does not fit
+    into it (e.g. a resized float image in a uint8 pack) raises a ValueError instead of being truncated."""
+    source = ImageGenerator(file_path, label_path, 1, image_size, cache='none')
+    os.makedirs(pack_path, exist_ok=True)
+
+    # The rest is written straight into the memory map
+    if dtype is None:
+        dtype = source._get_image(0)[0].dtype
+    images = np.lib.format.open_memmap(os.path.join(pack_path, 'images.npy'), mode='w+', dtype=dtype,
+                                       shape=(source.num_samples,) + tuple(image_size))
+    labels = np.zeros(source.num_samples, dtype=np.int32)
+    for i in range(source.num_samples):
+        img, labels[i] = source._get_image(i)
+        if not np.can_cast(img.dtype, images.dtype, casting='same_kind'):
+            raise ValueError(f"Image {i} has dtype {img.dtype}, which cannot be stored as {images.dtype}. "
+                             f"Pass e.g. dtype=np.float32 to pack_dataset.")
+        images[i] = img
+    images.flush()
+    del images
+
+    np.save(os.path.join(pack_path, 'labels.npy'), labels)
+    np.save(os.path.join(pack_path, 'files.npy'), np.array(source.files))
+    return pack_path
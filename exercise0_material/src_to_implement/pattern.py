@@ -1,122 +1,666 @@
+import threading
+from collections import OrderedDict
+from functools import lru_cache, reduce
 import numpy as np
+import matplotlib.colors
 import matplotlib.pyplot as plt
 
+from preview import display_image, save_image, submit_preview
+
+# Least recently used cache of rendered images shared by all patterns
+class RenderCache:
+    def __init__(self, max_bytes=256 * 2**20):
+        self.max_bytes = max_bytes    # Total size of the cached images
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            image = self._entries.get(key)
+            if image is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return image
+
+    def put(self, key, image):
+        # Images larger than the whole cache are not stored
+        if image.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.nbytes -= old.nbytes
+            self._entries[key] = image
+            self.nbytes += image.nbytes
+            # Evict the least recently used images until the new one fits
+            while self.nbytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'nbytes': self.nbytes, 'hits': self.hits,
+                    'misses': self.misses, 'evictions': self.evictions}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+render_cache = RenderCache()
+
+# Upper bound of the per-chunk temporaries of the batch API
+BATCH_CHUNK_BYTES = 64 * 2**20
+
+# Output types of the binary patterns (Checker and Circle)
+BINARY_DTYPES = (np.bool_, np.uint8, np.float16, np.float32)
+
+def _binary_dtype(dtype):
+    # Check and normalise the output type of a binary pattern
+    dtype = np.dtype(dtype)
+    if dtype.type not in BINARY_DTYPES:
+        raise ValueError(f"dtype must be one of {[np.dtype(d).name for d in BINARY_DTYPES]}")
+    return dtype.type
+
+def _disk_area_above(x0, x1, h, r):
+    # Area of the disk of radius r around the origin inside [x0, x1] x [h, inf) for h >= 0,
+    # integral of the chord height sqrt(r^2 - x^2) - h over the x where it is positive
+    s = np.sqrt(np.maximum(r * r - h * h, 0.0))
+    a = np.clip(x0, -s, s)
+    b = np.clip(x1, -s, s)
+
+    def primitive(x):
+        return 0.5 * (x * np.sqrt(np.maximum(r * r - x * x, 0.0)) + r * r * np.arcsin(np.clip(x / r, -1.0, 1.0))) - h * x
+
+    return primitive(b) - primitive(a)
+
+def _disk_area_from(x0, x1, y, r):
+    # Area of the disk inside [x0, x1] x [y, inf) for any y, using the symmetry of the disk for y < 0
+    above = _disk_area_above(x0, x1, np.abs(y), r)
+    return np.where(y >= 0, above, 2 * _disk_area_above(x0, x1, 0.0, r) - above)
+
+def pixel_coverage(dx, dy, radius):
+    """
+    Exact fraction of the unit pixels centred at (dx, dy), relative to the circle centre, covered by the disk.
+    :param dx: Horizontal offsets of the pixel centres.
+    :param dy: Vertical offsets of the pixel centres.
+    :param radius: Radius of the circle (> 0).
+    :return: Coverage in [0, 1] with the broadcast shape of dx and dy.
+    """
+    dx = np.asarray(dx, dtype=np.float64)
+    dy = np.asarray(dy, dtype=np.float64)
+    coverage = _disk_area_from(dx - 0.5, dx + 0.5, dy - 0.5, radius) - _disk_area_from(dx - 0.5, dx + 0.5, dy + 0.5, radius)
+    return np.clip(coverage, 0.0, 1.0)
+
+def pack_bits(images):
+    """
+    Pack binary images along the last axis into uint8 bits, eight pixels per byte.
+    :param images: Array of 0/1 values of any of the BINARY_DTYPES.
+    :return: uint8 array whose last axis is ceil(width / 8) long.
+    """
+    return np.packbits(np.asarray(images) != 0, axis=-1)
+
+def unpack_bits(packed, width, dtype=np.float32):
+    """
+    Inverse of pack_bits, also for slices of a packed stack (e.g. some images or rows of a memmap).
+    :param packed: Packed uint8 array.
+    :param width: Width of the unpacked images, which removes the padding bits of the last byte.
+    :param dtype: Output type, one of the BINARY_DTYPES.
+    :return: Array of 0/1 values.
+    """
+    dtype = _binary_dtype(dtype)
+    bits = np.unpackbits(packed, axis=-1, count=width)
+    # unpackbits yields uint8 0/1, which reinterprets as bool without a copy
+    return bits.view(np.bool_) if dtype is np.bool_ else bits.astype(dtype, copy=False)
+
+# Base class of the patterns: renders the image tile by tile, so memory is bounded by the tile size
+class Pattern:
+    channels = ()         # Trailing shape of one pixel, () for gray and (3,) for RGB
+    dtype = np.float32    # Data type of the rendered image
+    cache = render_cache  # Cache of the images of draw(copy=False), None renders on every draw
+    render_tile_size = None  # Tile size of draw() and draw_into(), None renders the image at once
+
+    # Let numpy arrays and scalars defer arithmetic with patterns to the operators below
+    __array_ufunc__ = None
+
+    def shape(self):
+        # Full image shape
+        return (self.resolution, self.resolution) + self.channels
+
+    def _params(self):
+        # Parameters that determine the image besides class, resolution and dtype
+        return ()
+
+    def cache_key(self):
+        # Key of the rendered image in the render cache
+        return (type(self).__name__, self.resolution, self._params(), np.dtype(self.dtype).str)
+
+    def _validate(self):
+        # Check the parameters before rendering (nothing to check by default)
+        pass
+
+    def _is_binary(self):
+        # Whether every pixel is 0 or 1, so that the image can be bit-packed
+        return not self.channels
+
+    def _render(self, out, rows, cols):
+        # Fill out with the part of the image given by the row and column slices
+        raise NotImplementedError("Rendering not implemented.")
+
+    def _tile(self, rows, cols):
+        # Render the part of the image given by the row and column slices into a new array
+        tile = np.empty((rows.stop - rows.start, cols.stop - cols.start) + self.channels, dtype=self.dtype)
+        self._render(tile, rows, cols)
+        return tile
+
+    def tiles(self, tile_size=1024):
+        """
+        Render the pattern in square tiles of at most tile_size pixels per side.
+        :param tile_size: Side length of the tiles.
+        :return: Generator of (row slice, column slice, tile) in row-major order.
+        """
+        self._validate()
+        for row in range(0, self.resolution, tile_size):
+            rows = slice(row, min(row + tile_size, self.resolution))
+            for col in range(0, self.resolution, tile_size):
+                cols = slice(col, min(col + tile_size, self.resolution))
+                yield rows, cols, self._tile(rows, cols)
+
+    def draw_into(self, out=None, tile_size=None):
+        """
+        Render the full pattern directly into out, e.g. a preallocated array or an np.memmap.
+        :param out: Array of shape self.shape(), allocated when None.
+        :param tile_size: Render tile by tile to bound the temporaries, None uses render_tile_size.
+        :return: out
+        """
+        self._validate()
+        if out is None:
+            out = np.empty(self.shape(), dtype=self.dtype)
+        elif out.shape != self.shape():
+            raise ValueError(f"out must have shape {self.shape()}")
+        if tile_size is None:
+            tile_size = self.render_tile_size or self.resolution
+        for row in range(0, self.resolution, tile_size):
+            rows = slice(row, min(row + tile_size, self.resolution))
+            for col in range(0, self.resolution, tile_size):
+                cols = slice(col, min(col + tile_size, self.resolution))
+                self._render(out[rows, cols], rows, cols)
+        return out
+
+    def draw(self, copy=True):
+        """
+        Render the pattern.
+        :param copy: Store the image in self.output and return a writable copy of it. Otherwise the image is
+        taken from the render cache if the same image was drawn before, and the shared read-only image itself
+        is stored in self.output and returned.
+        :return: The image.
+        """
+        if copy:
+            self.output = self.draw_into()
+            return self.output.copy()
+        self.output = self._shared_image()
+        return self.output
+
+    def _shared_image(self):
+        # Read-only image from the render cache, rendered and added to it on a miss
+        output = None if self.cache is None else self.cache.get(self.cache_key())
+        if output is None:
+            output = self.draw_into()
+            # Cached images are shared between patterns and must not be modified
+            output.flags.writeable = False
+            if self.cache is not None:
+                self.cache.put(self.cache_key(), output)
+        return output
+
+    def show(self, path=None, background=False):
+        """
+        Display the pattern, or write it to a PNG file without any GUI.
+        :param path: PNG file to write instead of opening a blocking window.
+        :param background: Write the file on the preview thread and return a Future instead of the path.
+        """
+        if path is None:
+            # Draw image if not already created
+            if self.output is None:
+                self.draw()
+            image, kwargs = display_image(self.output)
+            plt.imshow(image, **kwargs)
+            plt.axis('off')
+            plt.tight_layout()
+            plt.show()
+            return None
+
+        # The cached image is read-only, so the preview thread can use it without a copy. self.output is left
+        # alone, it stays the pattern's own writable image
+        image = self._shared_image()
+        if background:
+            return submit_preview(save_image, image, path)
+        return save_image(image, path)
+
+    # Building blocks of pattern expressions, evaluated lazily (see Composite)
+    def __add__(self, other):
+        return Add(self, other)
+
+    def __radd__(self, other):
+        return Add(other, self)
+
+    def __mul__(self, other):
+        return Multiply(self, other)
+
+    def __rmul__(self, other):
+        return Multiply(other, self)
+
+    def mask(self, inside, outside=0.0):
+        # Use this pattern as mask (or coverage) choosing between inside and outside
+        return Mask(self, inside, outside)
+
+    def colourize(self, low=(0.0, 0.0, 0.0), high=(1.0, 1.0, 1.0)):
+        # Map this gray pattern to an RGB gradient from low to high
+        return Colourize(self, low, high)
+
+    def draw_packed(self, out=None, rows_per_tile=None):
+        """
+        Render a binary pattern bit-packed along the rows (see pack_bits), one band of rows at a time.
+        :param out: Optional uint8 array of shape (resolution, ceil(resolution / 8)), e.g. an np.memmap.
+        :param rows_per_tile: Rows rendered at once, by default as many as fit into BATCH_CHUNK_BYTES as bools.
+        :return: out
+        """
+        if not self._is_binary():
+            raise ValueError("Only binary patterns can be bit-packed")
+        self._validate()
+        res = self.resolution
+        shape = (res, (res + 7) // 8)
+        if out is None:
+            out = np.empty(shape, dtype=np.uint8)
+        elif out.shape != shape:
+            raise ValueError(f"out must have shape {shape}")
+        if rows_per_tile is None:
+            rows_per_tile = max(1, BATCH_CHUNK_BYTES // res)
+
+        # Bands are rendered as bools into one reusable buffer and then packed
+        scratch = np.empty((min(rows_per_tile, res), res), dtype=bool)
+        for row in range(0, res, rows_per_tile):
+            rows = slice(row, min(row + rows_per_tile, res))
+            band = scratch[:rows.stop - rows.start]
+            self._render(band, rows, slice(0, res))
+            out[rows] = np.packbits(band, axis=-1)
+        return out
+
+    @classmethod
+    def _render_batch(cls, n, resolution, render, out, chunk_size, packbits, dtype):
+        # Render n masks chunk by chunk with render(out, start, stop) into an (n, resolution, resolution) stack
+        width = (resolution + 7) // 8 if packbits else resolution
+        shape = (n, resolution, width)
+        if out is None:
+            out = np.empty(shape, dtype=np.uint8 if packbits else dtype)
+        elif out.shape != shape:
+            raise ValueError(f"out must have shape {shape}")
+        if chunk_size is None:
+            chunk_size = max(1, BATCH_CHUNK_BYTES // (resolution * resolution * 4))
+
+        # Packed masks are rendered into one reusable boolean buffer first
+        scratch = np.empty((min(chunk_size, n), resolution, resolution), dtype=bool) if packbits else None
+        for start in range(0, n, chunk_size):
+            stop = min(start + chunk_size, n)
+            if packbits:
+                render(scratch[:stop - start], start, stop)
+                out[start:stop] = np.packbits(scratch[:stop - start], axis=-1)
+            else:
+                render(out[start:stop], start, stop)
+        return out
+
 # Class to generate a checkerboard pattern
-class Checker:
-    def __init__(self, resolution, tile_size):
-        self.resolution = resolution  # Size of the image (resolution x resolution)
-        self.tile_size = tile_size    # Size of each square tile
-        self.output = None            # Will hold the final pattern
+class Checker(Pattern):
+    def __init__(self, resolution, tile_size, dtype=np.float32):
+        self.resolution = resolution        # Size of the image (resolution x resolution)
+        self.tile_size = tile_size          # Size of each square tile
+        self.dtype = _binary_dtype(dtype)   # Output type: bool, uint8, float16 or float32
+        self.output = None                  # Will hold the final pattern
 
-    def draw(self):
+    def _params(self):
+        return (self.tile_size,)
+
+    def _validate(self):
         # Ensure resolution is divisible by twice the tile size
         if self.resolution % (2 * self.tile_size) != 0:
             raise ValueError("resolution must be divisible by 2 * tile_size")
-        
-        # Calculate how many 2x2 blocks fit into the image
-        pairs = self.resolution // (2 * self.tile_size)
-
-        # Base 2x2 checker tile (black and white)
-        base = np.array([[0, 1],
-                         [1, 0]], dtype=np.float32)
-
-        # Tile the base to fill the entire board area
-        board = np.tile(base, (pairs, pairs))
-
-        # Create a tile_size x tile_size block of ones to scale up each tile
-        #
-        block = np.ones((self.tile_size, self.tile_size), dtype=np.float32)
-
-        # Expand each checker tile to the appropriate size using the Kronecker product
-        output = np.kron(board, block)
-
-        self.output = output
-        return output.copy()
-
-    def show(self):
-        # Draw pattern if not already drawn
-        if self.output is None:
-            self.draw()
-        # Display the checkerboard pattern
-        plt.imshow(self.output, cmap='gray', vmin=0, vmax=1)
-        plt.axis('off')
-        plt.show()
-
-# Class to generate a binary image of a filled circle
-class Circle:
-    def __init__(self, resolution, radius, position):
-        self.resolution = resolution  # Size of the image
-        self.radius = radius          # Radius of the circle
-        self.position = position      # Position of the center (can be scalar or (x, y))
-        self.output = None            # Will hold the final image
-
-    def draw(self):
-        # Create coordinate grids for x and y axes
-        ix = np.arange(self.resolution, dtype=np.float32)
-        iy = np.arange(self.resolution, dtype=np.float32)[:, None]
 
+    def _render(self, out, rows, cols):
+        # Parity of the checker tile each row and column falls into
+        row_parity = (np.arange(rows.start, rows.stop) // self.tile_size) % 2
+        col_parity = (np.arange(cols.start, cols.stop) // self.tile_size) % 2
+
+        # A pixel is white where the parities differ, so the upper left tile is black
+        np.not_equal(row_parity[:, None], col_parity[None, :], out=out)
+
+    @classmethod
+    def batch(cls, resolution, tile_sizes, out=None, chunk_size=None, packbits=False, dtype=np.float32):
+        """
+        Render one checkerboard per tile size in a single vectorized pass per chunk.
+        :param resolution: Size of every board.
+        :param tile_sizes: Array of N tile sizes.
+        :param out: Optional output array of shape (N, resolution, resolution), or (N, resolution, ceil(resolution / 8))
+        with packbits.
+        :param chunk_size: Boards rendered at once, by default as many as fit into BATCH_CHUNK_BYTES.
+        :param packbits: Pack the boards along the last axis into uint8 bits (see pack_bits).
+        :param dtype: Output type without packbits, one of the BINARY_DTYPES.
+        :return: Stack of the boards.
+        """
+        tile_sizes = np.asarray(tile_sizes, dtype=np.int64).reshape(-1)
+        if np.any(tile_sizes <= 0) or np.any(resolution % (2 * np.maximum(tile_sizes, 1)) != 0):
+            raise ValueError("resolution must be divisible by 2 * tile_size")
+        pixels = np.arange(resolution)
+
+        def render(out, start, stop):
+            # Boards are symmetric, so rows and columns share their parities
+            parity = (pixels // tile_sizes[start:stop, None]) % 2
+            np.not_equal(parity[:, :, None], parity[:, None, :], out=out)
+
+        return cls._render_batch(len(tile_sizes), resolution, render, out, chunk_size, packbits,
+                                 _binary_dtype(dtype))
+
+# Class to generate a binary image of a filled circle, or its anti-aliased coverage
+class Circle(Pattern):
+    def __init__(self, resolution, radius, position, dtype=np.float32, antialias=False):
+        self.resolution = resolution        # Size of the image
+        self.radius = radius                # Radius of the circle
+        self.position = position            # Position of the center (can be scalar or (x, y))
+        self.dtype = _binary_dtype(dtype)   # Output type: bool, uint8, float16 or float32
+        self.antialias = antialias          # Pixel values are the covered fraction of the pixel area
+        self.output = None                  # Will hold the final image
+        if antialias and not np.issubdtype(self.dtype, np.floating):
+            raise ValueError("antialias needs a floating point dtype")
+
+    def _center(self):
         # Handle both scalar and tuple positions
         pos = self.position
         if isinstance(pos, (int, float)):
-            cx = cy = float(pos)  # If single value, assume square center
-        else:
-            cx, cy = pos          # Unpack center coordinates
-        
+            return float(pos), float(pos)  # If single value, assume square center
+        return pos                         # Unpack center coordinates
+
+    def _params(self):
+        return (self.radius, tuple(float(v) for v in self._center()), self.antialias)
+
+    def _is_binary(self):
+        return not self.antialias
+
+    def _render(self, out, rows, cols):
+        if self.antialias:
+            self._render_coverage(out, rows, cols)
+            return
+
+        # Create coordinate grids for x and y axes of this part of the image
+        ix = np.arange(cols.start, cols.stop, dtype=np.float32)
+        iy = np.arange(rows.start, rows.stop, dtype=np.float32)[:, None]
+        cx, cy = self._center()
+
         # Compute squared distance from the center for each pixel
         dist2 = (ix - cx)**2 + (iy - cy)**2
 
-        # Mask pixels within the radius (creates a filled circle)
-        mask = dist2 <= (self.radius ** 2)
-
-        # Create an empty black image
-        output = np.zeros((self.resolution, self.resolution), dtype=np.float32)
-        output[mask] = 1.0  # Set pixels inside the circle to white
-
-        self.output = output
-        return output.copy()
-
-    def show(self):
-        # Draw image if not already created
-        if self.output is None:
-            self.draw()
-        # Display the circle image
-        plt.imshow(self.output, cmap='gray', vmin=0, vmax=1)
-        plt.axis('off')
-        plt.tight_layout()
-        plt.show()
-
-# Class to generate a smooth RGB spectrum across the image
-class Spectrum:
-    def __init__(self, resolution):
-        self.resolution = resolution  # Image resolution
-        self.output = None            # Will hold the RGB image
-
-    def draw(self):
-        res = self.resolution
-        # Generate normalized coordinates from 0 to 1
-        x = np.linspace(0.0, 1.0, res, dtype=np.float32)
-        y = np.linspace(0.0, 1.0, res, dtype=np.float32)
-
-        # Create coordinate grid
-        X, Y = np.meshgrid(x, y)
-
-        # Define RGB color channels
-        R = X             # Red increases from left to right
-        G = Y             # Green increases from top to bottom
-        B = 1.0 - X       # Blue decreases from left to right
-
-        # Combine channels into one RGB image
-        spectrum = np.stack([R, G, B], axis=2)
-
-        self.output = spectrum
-        return spectrum.copy()
-
-    def show(self):
-        # Draw image if not already created
-        if self.output is None:
-            self.draw()
-        # Display the RGB spectrum image
-        plt.imshow(self.output)
-        plt.axis('off')
-        plt.tight_layout()
-        plt.show()
\ No newline at end of file
+        # Pixels within the radius are white (creates a filled circle)
+        np.less_equal(dist2, self.radius ** 2, out=out)
+
+    def _render_coverage(self, out, rows, cols):
+        # Anti-aliased rendering: each row is 0 outside the circle, 1 on the span of pixels lying completely
+        # inside and only the few pixels crossed by the boundary get their exact coverage computed
+        cx, cy = (float(v) for v in self._center())
+        r = float(self.radius)
+        out[...] = 0
+        if r <= 0:
+            return
+
+        # Vertical extent of each pixel row relative to the centre
+        top = np.arange(rows.start, rows.stop) - 0.5 - cy
+        bottom = top + 1.0
+        far2 = np.maximum(top * top, bottom * bottom)
+        near2 = np.where((top <= 0) & (bottom >= 0), 0.0, np.minimum(top * top, bottom * bottom))
+
+        # Half widths of the circle over the row: pixels within the narrowest one are covered completely,
+        # pixels outside the widest one not at all
+        inner = np.sqrt(np.maximum(r * r - far2, 0.0))
+        outer = np.sqrt(np.maximum(r * r - near2, 0.0))
+        full_start = np.clip(np.ceil(cx - inner + 0.5), cols.start, cols.stop).astype(np.int64)
+        full_stop = np.clip(np.floor(cx + inner - 0.5) + 1, cols.start, cols.stop).astype(np.int64)
+        edge_start = np.clip(np.floor(cx - outer - 0.5) + 1, cols.start, cols.stop).astype(np.int64)
+        edge_stop = np.clip(np.ceil(cx + outer + 0.5), cols.start, cols.stop).astype(np.int64)
+        empty = full_start >= full_stop
+        full_start[empty] = full_stop[empty] = edge_stop[empty]
+
+        # Span fill the interior of each row
+        inside = near2 < r * r
+        for i, start, stop in zip(np.flatnonzero(inside).tolist(), full_start[inside].tolist(),
+                                  full_stop[inside].tolist()):
+            out[i, start - cols.start:stop - cols.start] = 1
+
+        # Boundary pixels left and right of the spans, gathered for one vectorized coverage computation
+        edge_rows, edge_cols = [], []
+        for starts, stops in ((edge_start, full_start), (full_stop, edge_stop)):
+            lengths = np.where(inside, stops - starts, 0)
+            row_index = np.repeat(np.arange(len(lengths)), lengths)
+            offsets = np.arange(len(row_index)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+            edge_rows.append(row_index)
+            edge_cols.append(starts[row_index] + offsets)
+        edge_rows = np.concatenate(edge_rows)
+        edge_cols = np.concatenate(edge_cols)
+        out[edge_rows, edge_cols - cols.start] = pixel_coverage(edge_cols - cx, edge_rows + rows.start - cy, r)
+
+    @classmethod
+    def batch(cls, resolution, radii, positions, out=None, chunk_size=None, packbits=False, dtype=np.float32):
+        """
+        Render one circle per centre and radius in a single vectorized pass per chunk.
+        :param resolution: Size of every image.
+        :param radii: Array of N radii, or one radius for all circles.
+        :param positions: Array of N centres (x, y), or of N scalar centres.
+        :param out: Optional output array of shape (N, resolution, resolution), or (N, resolution, ceil(resolution / 8))
+        with packbits.
+        :param chunk_size: Images rendered at once, by default as many as fit into BATCH_CHUNK_BYTES.
+        :param packbits: Pack the masks along the last axis into uint8 bits (see pack_bits).
+        :param dtype: Output type without packbits, one of the BINARY_DTYPES.
+        :return: Stack of the masks.
+        """
+        # Same float32 arithmetic as a single Circle, so both give identical masks
+        positions = np.asarray(positions, dtype=np.float32)
+        if positions.ndim == 1:
+            positions = np.stack([positions, positions], axis=1)
+        radii2 = np.broadcast_to((np.asarray(radii, dtype=np.float64) ** 2).astype(np.float32), (len(positions),))
+        pixels = np.arange(resolution, dtype=np.float32)
+
+        def render(out, start, stop):
+            # Squared distances along each axis, combined by broadcasting
+            dx2 = (pixels - positions[start:stop, 0, None])**2
+            dy2 = (pixels - positions[start:stop, 1, None])**2
+            np.less_equal(dx2[:, None, :] + dy2[:, :, None], radii2[start:stop, None, None], out=out)
+
+        return cls._render_batch(len(positions), resolution, render, out, chunk_size, packbits,
+                                 _binary_dtype(dtype))
+
+# Colour spaces in which gradient stops can be interpolated, with their conversion to RGB
+COLOUR_SPACES = {'rgb': lambda colours: colours, 'hsv': matplotlib.colors.hsv_to_rgb}
+
+def _is_colour_list(stops):
+    # Whether the stops are plain colours rather than (position, colour) pairs
+    try:
+        return np.asarray(stops, dtype=np.float64).shape == (len(stops), 3)
+    except (TypeError, ValueError):
+        return False
+
+def _gradient_stops(stops):
+    # Normalise gradient stops to a hashable tuple of (position, (c0, c1, c2)), colours alone are spaced evenly
+    stops = list(stops)
+    if len(stops) < 2:
+        raise ValueError("A gradient needs at least two stops")
+    if _is_colour_list(stops):
+        stops = list(zip(np.linspace(0.0, 1.0, len(stops)).tolist(), stops))
+    try:
+        stops = tuple((float(position), tuple(float(c) for c in colour)) for position, colour in stops)
+    except (TypeError, ValueError):
+        raise ValueError("Gradient stops must be colours or (position, colour) pairs") from None
+    positions = [position for position, _ in stops]
+    if any(len(colour) != 3 for _, colour in stops) or positions != sorted(positions):
+        raise ValueError("Gradient stops need three colour components and increasing positions")
+    return stops
+
+@lru_cache(maxsize=256)
+def gradient_ramp(stops, colour_space, resolution):
+    """
+    RGB colours of a gradient sampled at resolution evenly spaced points from 0 to 1, shared by all spectra.
+    :param stops: Normalised gradient stops, a tuple of (position, colour) pairs.
+    :param colour_space: Space the colours are given and interpolated in, a key of COLOUR_SPACES.
+    :param resolution: Number of samples.
+    :return: Read-only float32 array of shape (resolution, 3).
+    """
+    t = np.linspace(0.0, 1.0, resolution)
+    positions = [position for position, _ in stops]
+    colours = np.array([colour for _, colour in stops])
+    ramp = np.stack([np.interp(t, positions, colours[:, c]) for c in range(3)], axis=1)
+    ramp = np.asarray(COLOUR_SPACES[colour_space](ramp), dtype=np.float32)
+    ramp.flags.writeable = False
+    return ramp
+
+# Class to generate a smooth RGB spectrum across the image: the sum of a horizontal and a vertical gradient
+class Spectrum(Pattern):
+    channels = (3,)
+
+    def __init__(self, resolution, horizontal=((0, 0, 1), (1, 0, 0)), vertical=((0, 0, 0), (0, 1, 0)),
+                 colour_space='rgb'):
+        if colour_space not in COLOUR_SPACES:
+            raise ValueError(f"colour_space must be one of {list(COLOUR_SPACES)}")
+        self.resolution = resolution                    # Image resolution
+        self.horizontal = _gradient_stops(horizontal)   # Gradient from left to right (default: blue to red)
+        self.vertical = _gradient_stops(vertical)       # Gradient from top to bottom (default: green increasing)
+        self.colour_space = colour_space                # Colour space of the gradient stops
+        self.output = None                              # Will hold the RGB image
+
+    def _params(self):
+        return (self.horizontal, self.vertical, self.colour_space)
+
+    def ramps(self):
+        # The 1-D horizontal and vertical RGB ramps the image is built from
+        return (gradient_ramp(self.horizontal, self.colour_space, self.resolution),
+                gradient_ramp(self.vertical, self.colour_space, self.resolution))
+
+    def channel(self, c):
+        """
+        One colour channel of the image without rendering the whole image.
+        :param c: Channel index (0 = red, 1 = green, 2 = blue).
+        :return: Read-only broadcast view of a 1-D ramp if the channel changes along at most one axis,
+        otherwise the materialised (resolution, resolution) channel.
+        """
+        horizontal, vertical = self.ramps()
+        shape = (self.resolution, self.resolution)
+        x, y = horizontal[:, c], vertical[:, c]
+        if np.all(y == y[0]):
+            return np.broadcast_to(x + y[0] if y[0] else x, shape)
+        if np.all(x == x[0]):
+            return np.broadcast_to((y + x[0] if x[0] else y)[:, None], shape)
+        return np.add(y[:, None], x[None, :])
+
+    def _render(self, out, rows, cols):
+        # Sum of the broadcast ramps without coordinate grids, one channel at a time because
+        # broadcasting over a trailing axis of length 3 is several times slower
+        horizontal, vertical = self.ramps()
+        for c in range(3):
+            np.add(vertical[rows, c, None], horizontal[None, cols, c], out=out[..., c])
+
+# Base class of lazy pattern expressions. Operands are patterns of the same resolution or constants (scalars or RGB
+# triples). Nothing is rendered when the expression is built; rendering evaluates the whole expression tile by tile,
+# so all intermediate results are tile-sized.
+class Composite(Pattern):
+    render_tile_size = 256
+
+    def __init__(self, *operands):
+        patterns = [op for op in operands if isinstance(op, Pattern)]
+        if not patterns:
+            raise ValueError("A composite needs at least one pattern operand")
+        if any(p.resolution != patterns[0].resolution for p in patterns):
+            raise ValueError("All patterns of a composite must have the same resolution")
+        self.resolution = patterns[0].resolution
+        self.operands = [op if isinstance(op, Pattern) else np.asarray(op, dtype=np.float32) for op in operands]
+        if any(not isinstance(op, Pattern) and op.shape not in ((), (3,)) for op in self.operands):
+            raise ValueError("Constants must be scalars or RGB triples")
+        self.channels = (3,) if any(self._operand_channels(op) for op in self.operands) else ()
+        self.output = None
+
+    @staticmethod
+    def _operand_channels(operand):
+        return operand.channels if isinstance(operand, Pattern) else operand.shape
+
+    def _params(self):
+        return tuple(op.cache_key() if isinstance(op, Pattern) else tuple(op.reshape(-1).tolist())
+                     for op in self.operands)
+
+    def _validate(self):
+        for op in self.operands:
+            if isinstance(op, Pattern):
+                op._validate()
+
+    def _is_binary(self):
+        return False
+
+    def _operand_tile(self, operand, rows, cols):
+        # Value of an operand on a tile, as float32 that broadcasts against the channels of the result
+        if not isinstance(operand, Pattern):
+            return operand
+        tile = operand._tile(rows, cols)
+        if not np.issubdtype(tile.dtype, np.floating):
+            tile = tile.astype(np.float32)
+        if self.channels and not operand.channels:
+            tile = tile[..., None]
+        return tile
+
+    def _combine(self, *values):
+        # Combine the tiles (or constants) of the operands
+        raise NotImplementedError("Combination not implemented.")
+
+    def _tile(self, rows, cols):
+        values = [self._operand_tile(op, rows, cols) for op in self.operands]
+        value = self._combine(*values)
+        return np.broadcast_to(value, (rows.stop - rows.start, cols.stop - cols.start) + self.channels).astype(
+            self.dtype, copy=False)
+
+    def _render(self, out, rows, cols):
+        out[...] = self._tile(rows, cols)
+
+# Sum of patterns and constants
+class Add(Composite):
+    def _combine(self, *values):
+        return reduce(np.add, values)
+
+# Product of patterns and constants
+class Multiply(Composite):
+    def _combine(self, *values):
+        return reduce(np.multiply, values)
+
+# Blend between inside and outside by a (binary or anti-aliased) gray mask
+class Mask(Composite):
+    def __init__(self, mask, inside, outside=0.0):
+        if not isinstance(mask, Pattern) or mask.channels:
+            raise ValueError("mask must be a gray pattern")
+        super().__init__(mask, inside, outside)
+
+    def _combine(self, mask, inside, outside):
+        return outside + mask * (inside - outside)
+
+# Map a gray pattern to RGB by interpolating from colour low (value 0) to colour high (value 1)
+class Colourize(Composite):
+    def __init__(self, pattern, low=(0.0, 0.0, 0.0), high=(1.0, 1.0, 1.0)):
+        if not isinstance(pattern, Pattern) or pattern.channels:
+            raise ValueError("Only gray patterns can be colourized")
+        if np.shape(low) != (3,) or np.shape(high) != (3,):
+            raise ValueError("low and high must be RGB triples")
+        super().__init__(pattern, low, high)
+
+    def _combine(self, gray, low, high):
+        return low + gray * (high - low)
@@ -0,0 +1,58 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import matplotlib.image
+from matplotlib.figure import Figure
+
+# Single background thread writing the previews, so that saving never stalls the caller
+_preview_executor = None
+_preview_lock = threading.Lock()
+
+def submit_preview(function, *args):
+    """Run function(*args) on the background preview thread and return its Future"""
+    global _preview_executor
+    with _preview_lock:
+        if _preview_executor is None:
+            _preview_executor = ThreadPoolExecutor(1, thread_name_prefix='preview')
+    return _preview_executor.submit(function, *args)
+
+def display_image(image):
+    """Return the image and the imshow/imsave arguments to display it: gray images are shown on [0, 1],
+    colour images clipped to the displayable range (0..255 floats are scaled)"""
+    image = np.asarray(image)
+    if image.ndim == 2:
+        return np.asarray(image, dtype=np.float32), {'cmap': 'gray', 'vmin': 0, 'vmax': 1}
+    if np.issubdtype(image.dtype, np.floating):
+        if image.size and image.max() > 1:
+            image = image / 255
+        image = np.clip(image, 0, 1)
+    return image, {}
+
+def save_image(image, path):
+    """Write one gray or RGB image pixel for pixel to a PNG file, without a figure or GUI backend"""
+    image, kwargs = display_image(image)
+    matplotlib.image.imsave(path, image, **kwargs)
+    return path
+
+def save_contact_sheet(images, path, titles=None, columns=5):
+    """
+    Write a grid of images to a PNG file with the non-interactive Agg canvas, safe to call off the main thread.
+    :param images: Sequence of gray or RGB images.
+    :param path: Output file.
+    :param titles: Optional title per image.
+    :param columns: Images per row.
+    :return: path
+    """
+    rows = max(1, -(-len(images) // columns))
+    fig = Figure(figsize=(3 * columns, 3 * rows))
+    axes = fig.subplots(rows, columns, squeeze=False).flatten()
+    for i, ax in enumerate(axes):
+        ax.axis('off')
+        if i < len(images):
+            image, kwargs = display_image(images[i])
+            ax.imshow(image, **kwargs)
+            if titles is not None:
+                ax.set_title(titles[i])
+    fig.tight_layout()
+    fig.savefig(path)
+    return path
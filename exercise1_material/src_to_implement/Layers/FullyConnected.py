@@ -2,21 +2,83 @@ import numpy as np
 
 class FullyConnected:
     def __init__(self, input_size, output_size):
+        """
+        Initialize the fully connected layer.
+        :param input_size: Number of input features.
+        :param output_size: Number of neurons.
+        """
         self.input_size = input_size
         self.output_size = output_size
-        self.weights = np.random.uniform(0, 1, (input_size, output_size))
-        self.bias = None
+        # Weights with the bias as last row, so that one matrix product computes x @ W + b
+        self.weights = np.random.uniform(0, 1, (input_size + 1, output_size))
         self.trainable = True
+        self.optimizer = None
+        self.precision = None
 
+        # Buffers reused across iterations: the input extended by a column of ones and the weight gradient
+        self._input_tensor = np.ones((0, input_size + 1))
+        self._gradient_weights = np.zeros_like(self.weights)
+
+    def set_precision(self, precision):
+        """
+        Keep the weights (the master copy for the optimizer) and the buffers in the compute type of a precision policy.
+        :param precision: Precision policy of the network.
+        """
+        self.precision = precision
+        self.weights = self.weights.astype(precision.compute_dtype)
+        self._gradient_weights = np.zeros_like(self.weights)
+        self._input_tensor = self._input_tensor.astype(precision.compute_dtype)
+
+    @property
+    def bias(self):
+        return self.weights[-1]
+
+    @bias.setter
+    def bias(self, value):
+        self.weights[-1] = value
+
+    @property
+    def gradient_weights(self):
+        return self._gradient_weights
+
+    @property
+    def gradient_bias(self):
+        return self._gradient_weights[-1]
 
     def forward(self, input_tensor):
-        # Implement the forward pass
-        pass
+        """
+        Compute the output of the layer.
+        :param input_tensor: Input tensor of shape (batch, input_size).
+        :return: Output tensor of shape (batch, output_size).
+        """
+        # The ones column is only written when the batch size changes, afterwards the input is copied in place
+        if self._input_tensor.shape[0] != input_tensor.shape[0]:
+            self._input_tensor = np.ones((input_tensor.shape[0], self.input_size + 1), dtype=self.weights.dtype)
+        self._input_tensor[:, :-1] = input_tensor
+        return self._input_tensor @ self.weights
 
-    def backward(self, grad_output):
-        # Implement the backward pass
-        pass
+    def backward(self, error_tensor):
+        """
+        Compute the gradients and update the weights if an optimizer is set.
+        :param error_tensor: Gradient of the loss with respect to the output.
+        :return: Gradient of the loss with respect to the input.
+        """
+        # The error of the previous layer uses the weights before the update and leaves out the bias row
+        previous_error = error_tensor @ self.weights[:-1].T
+        np.matmul(self._input_tensor.T, error_tensor, out=self._gradient_weights, casting='same_kind')
+        if self.precision is not None:
+            # Undo the loss scaling and report an overflow to the policy, the network applies the update once all
+            # layers are checked so that a step with an overflow is skipped by every layer
+            self._gradient_weights /= self.precision.loss_scale
+            if not np.all(np.isfinite(self._gradient_weights)):
+                self.precision.found_overflow = True
+            return previous_error
+        self.apply_update()
+        return previous_error
 
-    def update(self, learning_rate):
-        # Implement the weights and bias update
-        pass
\ No newline at end of file
+    def apply_update(self):
+        """
+        Update the weights with the gradient of the last backward pass if an optimizer is set.
+        """
+        if self.optimizer is not None:
+            np.copyto(self.weights, self.optimizer.calculate_update(self.weights, self._gradient_weights))
@@ -1,6 +1,5 @@
 import numpy as np
 from sklearn.datasets import load_iris
-from sklearn.preprocessing import OneHotEncoder
 from random import shuffle
 
 
@@ -108,35 +107,48 @@ def gradient_check_weights(layers, input_tensor, label_tensor, bias):
 
 
 def shuffle_data(input_tensor, label_tensor):
+    # Works for one-hot (2D) and integer (1D) labels alike
     index_shuffling = [i for i in range(input_tensor.shape[0])]
     shuffle(index_shuffling)
-    shuffled_input = [input_tensor[i, :] for i in index_shuffling]
-    shuffled_labels = [label_tensor[i, :] for i in index_shuffling]
-    return np.array(shuffled_input), np.array(shuffled_labels)
+    return input_tensor[index_shuffling], label_tensor[index_shuffling]
+
+
+def one_hot(labels, categories):
+    # One-hot encoding of integer class labels
+    label_tensor = np.zeros([len(labels), categories])
+    label_tensor[np.arange(len(labels)), labels] = 1
+    return label_tensor
 
 
 class RandomData:
-    def __init__(self, input_size, batch_size, categories):
+    def __init__(self, input_size, batch_size, categories, sparse_labels=False):
+        # sparse_labels: emit int32 class indices instead of one-hot label tensors
         self.input_size = input_size
         self.batch_size = batch_size
         self.categories = categories
-        self.label_tensor = np.zeros([self.batch_size, self.categories])
+        self.sparse_labels = sparse_labels
+        if sparse_labels:
+            self.label_tensor = np.zeros(self.batch_size, dtype=np.int32)
+        else:
+            self.label_tensor = np.zeros([self.batch_size, self.categories])
 
     def next(self):
         input_tensor = np.random.random([self.batch_size, self.input_size])
 
-        self.label_tensor = np.zeros([self.batch_size, self.categories])
-        for i in range(self.batch_size):
-            self.label_tensor[i, np.random.randint(0, self.categories)] = 1
+        labels = np.random.randint(0, self.categories, self.batch_size).astype(np.int32)
+        self.label_tensor = labels if self.sparse_labels else one_hot(labels, self.categories)
 
         return input_tensor, self.label_tensor
 
 
 class IrisData:
-    def __init__(self, batch_size):
+    def __init__(self, batch_size, sparse_labels=False):
+        # sparse_labels: emit int32 class indices instead of one-hot label tensors
         self.batch_size = batch_size
+        self.sparse_labels = sparse_labels
         self._data = load_iris()
-        self._label_tensor = OneHotEncoder(sparse=False).fit_transform(self._data.target.reshape(-1, 1))
+        labels = self._data.target.astype(np.int32)
+        self._label_tensor = labels if sparse_labels else one_hot(labels, labels.max() + 1)
         self._input_tensor = self._data.data
         self._input_tensor /= np.abs(self._input_tensor).max()
 
@@ -144,9 +156,9 @@ class IrisData:
 
         self._input_tensor, self._label_tensor = shuffle_data(self._input_tensor, self._label_tensor)
         self._input_tensor_train = self._input_tensor[:self.split, :]
-        self._label_tensor_train = self._label_tensor[:self.split, :]
+        self._label_tensor_train = self._label_tensor[:self.split]
         self._input_tensor_test = self._input_tensor[self.split:, :]
-        self._label_tensor_test = self._label_tensor[self.split:, :]
+        self._label_tensor_test = self._label_tensor[self.split:]
 
         self._current_forward_idx_iterator = self._forward_idx_iterator()
 
@@ -160,7 +172,7 @@ class IrisData:
 
     def next(self):
         idx = next(self._current_forward_idx_iterator)
-        return self._input_tensor_train[idx, :], self._label_tensor_train[idx, :]
+        return self._input_tensor_train[idx, :], self._label_tensor_train[idx]
 
     def get_test_set(self):
         return self._input_tensor_test, self._label_tensor_test
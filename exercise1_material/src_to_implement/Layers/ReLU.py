@@ -1,8 +1,18 @@
 import numpy as np
 
 class ReLU:
-    def __init__(self):
+    def __init__(self, inplace=False, packed_mask=False):
+        """
+        Initialize the ReLU layer.
+        :param inplace: Overwrite the input tensor in forward and the error tensor in backward instead of
+        allocating new ones. Only for callers that do not use these tensors afterwards.
+        :param packed_mask: Keep the mask of positive inputs as bits (np.packbits) instead of bools.
+        """
         self.trainable = False
+        self.inplace = inplace
+        self.packed_mask = packed_mask
+        self.mask = None    # Positive inputs of the last forward pass, all backward needs
+        self._shape = None
     
     def forward(self, input_tensor):
         """
@@ -10,10 +20,19 @@ class ReLU:
         :param input_tensor: Input tensor       
         :return: ReLU output
         """
+        # Remember where the input is positive, reusing the mask buffer while the shape stays the same
+        if self.packed_mask:
+            self.mask = np.packbits(input_tensor > 0, axis=None)
+        else:
+            if self.mask is None or self.mask.shape != input_tensor.shape:
+                self.mask = np.empty(input_tensor.shape, dtype=bool)
+            np.greater(input_tensor, 0, out=self.mask)
+        self._shape = input_tensor.shape
+
         # Apply ReLU activation function
-        self.input_tensor = input_tensor
-        output = np.maximum(0, input_tensor)
-        return output
+        if self.inplace:
+            return np.maximum(input_tensor, 0, out=input_tensor)
+        return np.maximum(input_tensor, 0)
     
     def backward(self, error_tensor):
         """
@@ -21,6 +40,11 @@ class ReLU:
         :param error_tensor: Gradient of the loss with respect to the output
         :return: Gradient of the loss with respect to the input
         """
-        # Compute the gradient of ReLU
-        gradient = np.where(self.input_tensor > 0, 1, 0)
-        return error_tensor * gradient
\ No newline at end of file
+        mask = self.mask
+        if self.packed_mask:
+            mask = np.unpackbits(mask, count=int(np.prod(self._shape))).reshape(self._shape).view(bool)
+
+        # The gradient is 1 for positive inputs and 0 otherwise, multiplying by the bool mask keeps the error type
+        if self.inplace:
+            return np.multiply(error_tensor, mask, out=error_tensor)
+        return error_tensor * mask
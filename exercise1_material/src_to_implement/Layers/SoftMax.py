@@ -6,22 +6,29 @@ class SoftMax:
         Initialize the SoftMax layer.
         """
         self.trainable = False
+        self.output = None  # Probabilities of the last forward pass, needed by backward
 
     def forward(self, input_tensor):
         """
-        Compute the softmax of the input tensor x.
-        :param x: Input tensor
+        Compute the softmax of every row (sample) of the input tensor.
+        :param input_tensor: Input tensor of shape (batch, categories)
         :return: Softmax output
         """
-        # Subtract the max for numerical stability
-        e_x = np.exp(input_tensor - np.max(input_tensor))
-        return e_x / e_x.sum(axis=0, keepdims=True)
+        # Subtract the maximum of each row for numerical stability, then exponentiate and normalise in place
+        output = input_tensor - np.max(input_tensor, axis=1, keepdims=True)
+        np.exp(output, out=output)
+        output /= np.sum(output, axis=1, keepdims=True)
+        self.output = output
+        return output
 
     def backward(self, error_tensor):
         """
         Compute the gradient of the softmax function.
-        :param grad_output: Gradient of the loss with respect to the output
+        :param error_tensor: Gradient of the loss with respect to the output
         :return: Gradient of the loss with respect to the input
         """
-        # which returns a tensor that serves as the error tensor for the previous layer.
-        return error_tensor
\ No newline at end of file
+        # y * (E - sum(E * y)) for every row, the Jacobian of the softmax applied without building it
+        weighted = np.sum(error_tensor * self.output, axis=1, keepdims=True)
+        gradient = error_tensor - weighted
+        gradient *= self.output
+        return gradient
@@ -1,23 +1,155 @@
+import copy
+import time
 import numpy as np
 
+class Precision:
+    def __init__(self, compute_dtype=np.float32, storage_dtype=None, loss_scale=1.0, dynamic_loss_scale=False,
+                 growth_interval=1000):
+        """
+        Network-wide precision policy.
+        :param compute_dtype: Type of the weights (the master copy the optimizer updates) and of all arithmetic.
+        :param storage_dtype: Type of the activations and errors passed between the layers, e.g. np.float16.
+        None keeps them in compute_dtype.
+        :param loss_scale: Factor applied to the loss gradient so that small errors do not underflow in
+        storage_dtype. Weight gradients are divided by it again before the update.
+        :param dynamic_loss_scale: Halve the scale after a step with an overflow and double it after
+        growth_interval steps without one.
+        :param growth_interval: Steps without overflow before the scale grows.
+        """
+        self.compute_dtype = np.dtype(compute_dtype)
+        self.storage_dtype = np.dtype(compute_dtype if storage_dtype is None else storage_dtype)
+        self.loss_scale = float(loss_scale)
+        self.dynamic_loss_scale = dynamic_loss_scale
+        self.growth_interval = growth_interval
+        self.found_overflow = False     # Set by the layers when a scaled gradient is not finite
+        self.skipped_steps = 0
+        self._good_steps = 0
+
+    def update_scale(self):
+        """
+        Adjust the loss scale after a training step and reset the overflow flag.
+        """
+        if self.found_overflow:
+            self.skipped_steps += 1
+            self._good_steps = 0
+            if self.dynamic_loss_scale:
+                self.loss_scale = max(self.loss_scale / 2, 1.0)
+        else:
+            self._good_steps += 1
+            if self.dynamic_loss_scale and self._good_steps >= self.growth_interval:
+                self.loss_scale *= 2
+                self._good_steps = 0
+        self.found_overflow = False
+
 class NeuralNetwork:
-    def __init__(self, layers, loss_function, optimizer):
+    def __init__(self, optimizer, precision=None):
         """
         Initialize the Neural Network.
-        :param layers: List of layers in the network.
-        :param loss_function: Loss function to be used.
-        :param optimizer: Optimizer to be used for weight updates.
+        :param optimizer: Optimizer to be used for weight updates, copied into every trainable layer.
+        :param precision: Optional Precision policy, None computes in the types numpy picks (float64).
         """
-        self.layers = layers
-        self.loss_function = loss_function
         self.optimizer = optimizer
+        self.precision = precision
+        self.layers = []
+        self.data_layer = None      # Provides the training batches via next()
+        self.loss_layer = None      # Computes the loss and its gradient
+        self.label_tensor = None    # Labels of the current batch, needed by backward()
+
+        # One entry per training iteration, grown once per call of train() instead of per iteration
+        self.loss = np.zeros(0)
+        self.forward_times = np.zeros(0)
+        self.backward_times = np.zeros(0)
+
+    def append_layer(self, layer):
+        """
+        Add a layer to the end of the network.
+        :param layer: Layer to add, trainable layers get their own copy of the optimizer.
+        """
+        if layer.trainable:
+            layer.optimizer = copy.deepcopy(self.optimizer)
+        if self.precision is not None and hasattr(layer, 'set_precision'):
+            layer.set_precision(self.precision)
+        self.layers.append(layer)
+
+    def _store(self, tensor):
+        # Cast a tensor passed between two layers to the storage type of the precision policy
+        if self.precision is None:
+            return tensor
+        return tensor.astype(self.precision.storage_dtype, copy=False)
+
+    def _compute(self, tensor):
+        # Cast a stored tensor to the compute type of the precision policy before a layer works on it
+        if self.precision is None:
+            return tensor
+        return tensor.astype(self.precision.compute_dtype, copy=False)
+
+    def _propagate(self, input_tensor):
+        # Forward pass through the layers. Every layer computes in compute precision, only the tensors passed
+        # between the layers are kept in the storage type. The output of the last layer is in compute precision
+        input_tensor = self._store(input_tensor)
+        for i, layer in enumerate(self.layers):
+            input_tensor = layer.forward(self._compute(input_tensor))
+            if i < len(self.layers) - 1:
+                input_tensor = self._store(input_tensor)
+        return self._compute(input_tensor)
+
+    def forward(self):
+        """
+        Perform a forward pass of the next batch of the data layer through the network and the loss layer.
+        :return: Loss of the batch.
+        """
+        input_tensor, self.label_tensor = self.data_layer.next()
+        return self.loss_layer.forward(self._propagate(input_tensor), self.label_tensor)
+
+    def backward(self):
+        """
+        Propagate the error of the last batch back through the network, the trainable layers update their weights.
+        """
+        error_tensor = self.loss_layer.backward(self.label_tensor)
+        if self.precision is None:
+            for layer in reversed(self.layers):
+                error_tensor = layer.backward(error_tensor)
+            return
+
+        # Overflows of the scaled errors are expected now and then, the layers only compute and check their
+        # gradients and the updates are applied afterwards, by all layers or, after an overflow, by none
+        error_tensor = error_tensor * self.precision.loss_scale
+        with np.errstate(over='ignore', invalid='ignore'):
+            for layer in reversed(self.layers):
+                error_tensor = self._store(layer.backward(self._compute(error_tensor)))
+        if not self.precision.found_overflow:
+            for layer in self.layers:
+                if hasattr(layer, 'apply_update'):
+                    layer.apply_update()
+        self.precision.update_scale()
+
+    def train(self, iterations):
+        """
+        Train the network, one batch of the data layer per iteration.
+        :param iterations: Number of iterations.
+        """
+        # Preallocate the records of this call behind those of earlier calls
+        start = len(self.loss)
+        self.loss = np.concatenate([self.loss, np.zeros(iterations)])
+        self.forward_times = np.concatenate([self.forward_times, np.zeros(iterations)])
+        self.backward_times = np.concatenate([self.backward_times, np.zeros(iterations)])
+
+        for i in range(start, start + iterations):
+            t0 = time.perf_counter()
+            self.loss[i] = self.forward()
+            t1 = time.perf_counter()
+            self.backward()
+            self.forward_times[i] = t1 - t0
+            self.backward_times[i] = time.perf_counter() - t1
 
-    def forward(self, input_tensor):
+    def test(self, input_tensor):
         """
-        Perform a forward pass through the network.
+        Perform a forward pass through the network without the loss layer.
         :param input_tensor: Input tensor to the network.
-        :return: Output tensor from the network.
+        :return: Output tensor from the network, e.g. the class probabilities.
         """
-        for layer in self.layers:
-            input_tensor = layer.forward(input_tensor)
-        return input_tensor
\ No newline at end of file
+        output = self._propagate(input_tensor)
+        # Loss layers that include the last activation (e.g. the fused SoftMax and CrossEntropy) apply it here
+        if hasattr(self.loss_layer, 'predict'):
+            output = self.loss_layer.predict(output)
+        return output
@@ -506,6 +506,257 @@ class TestNeuralNetwork1(unittest.TestCase):
                                "Have a look at the displayed loss curve.")
 
 
+class TestTrainingLoop(unittest.TestCase):
+
+    class Scale:
+        # Minimal trainable layer y = w * x, updating w with its optimizer in backward
+        def __init__(self):
+            self.trainable = True
+            self.weights = np.ones(1)
+
+        def forward(self, input_tensor):
+            self.input_tensor = input_tensor
+            return input_tensor * self.weights
+
+        def backward(self, error_tensor):
+            gradient = np.sum(error_tensor * self.input_tensor, keepdims=True).reshape(1)
+            self.weights = self.optimizer.calculate_update(self.weights, gradient)
+            return error_tensor * self.weights
+
+    class Doubling:
+        # Data layer with label = 2 * input
+        def next(self):
+            input_tensor = np.random.rand(8, 2)
+            return input_tensor, 2 * input_tensor
+
+    def test_train(self):
+        net = NeuralNetwork.NeuralNetwork(Optimizers.Sgd(0.05))
+        net.data_layer = self.Doubling()
+        net.loss_layer = L2Loss()
+        net.append_layer(self.Scale())
+        net.append_layer(ReLU.ReLU())
+
+        net.train(50)
+        self.assertEqual(net.loss.shape, (50,))
+        self.assertLess(net.loss[-1], 1e-3 * net.loss[0])
+        np.testing.assert_almost_equal(net.layers[0].weights, [2.], decimal=2)
+        np.testing.assert_almost_equal(net.test(np.ones((1, 2))), [[2., 2.]], decimal=2)
+
+        # Further training appends to the records
+        net.train(10)
+        self.assertEqual(net.loss.shape, (60,))
+        self.assertEqual(net.forward_times.shape, (60,))
+        self.assertTrue(np.all(net.forward_times > 0) and np.all(net.backward_times > 0))
+
+
+class TestFullyConnectedBuffers(unittest.TestCase):
+
+    def test_fused_bias(self):
+        # One product with the fused buffer equals x @ W + b
+        layer = FullyConnected.FullyConnected(5, 3)
+        input_tensor = np.random.rand(7, 5)
+        np.testing.assert_allclose(layer.forward(input_tensor), input_tensor @ layer.weights[:-1] + layer.bias)
+        error_tensor = np.random.rand(7, 3)
+        np.testing.assert_allclose(layer.backward(error_tensor), error_tensor @ layer.weights[:-1].T)
+        np.testing.assert_allclose(layer.gradient_weights[:-1], input_tensor.T @ error_tensor)
+        np.testing.assert_allclose(layer.gradient_bias, error_tensor.sum(axis=0))
+
+    def test_buffers_reused(self):
+        layer = FullyConnected.FullyConnected(5, 3)
+        layer.optimizer = Optimizers.Sgd(0.1)
+        weights, gradient_weights = layer.weights, layer.gradient_weights
+        for _ in range(3):
+            layer.backward(layer.forward(np.random.rand(7, 5)))
+        self.assertIs(layer.weights, weights)
+        self.assertIs(layer.gradient_weights, gradient_weights)
+        self.assertIs(layer.bias.base, weights)
+
+
+class TestMixedPrecision(unittest.TestCase):
+
+    class Recorder:
+        # Non-trainable identity layer remembering the types it sees and whether the values were stored in float16
+        def __init__(self):
+            self.trainable = False
+            self.types = []
+            self.stored = []
+
+        def forward(self, input_tensor):
+            self.types.append(input_tensor.dtype)
+            self.stored.append(np.array_equal(input_tensor, input_tensor.astype(np.float16)))
+            return input_tensor
+
+        def backward(self, error_tensor):
+            self.types.append(error_tensor.dtype)
+            return error_tensor
+
+    class Confident:
+        # Data layer with one sample the network below classifies with a very high probability
+        def next(self):
+            return np.array([[30., 0., 0.]]), np.array([[1., 0., 0.]])
+
+    def _network(self, precision):
+        np.random.seed(0)
+        net = NeuralNetwork.NeuralNetwork(Optimizers.Sgd(1e-3), precision)
+        net.data_layer = Helpers.RandomData(4, 16, 3)
+        net.loss_layer = L2Loss()
+        net.append_layer(FullyConnected.FullyConnected(4, 5))
+        net.append_layer(self.Recorder())
+        net.append_layer(FullyConnected.FullyConnected(5, 3))
+        return net
+
+    def test_types(self):
+        net = self._network(NeuralNetwork.Precision(np.float32, np.float16, loss_scale=128.))
+        net.train(20)
+        self.assertEqual(net.layers[0].weights.dtype, np.float32)
+        self.assertEqual(net.layers[2].gradient_weights.dtype, np.float32)
+        # Layers compute in float32, the tensors passed between them are stored in float16
+        self.assertEqual(set(net.layers[1].types), {np.dtype(np.float32)})
+        self.assertTrue(all(net.layers[1].stored))
+        self.assertEqual(net.test(np.random.rand(2, 4)).dtype, np.float32)
+
+    def test_activations_in_compute_precision(self):
+        # SoftMax and the loss run in float32 behind a float16 storage type, so a confident prediction gives no nan
+        net = NeuralNetwork.NeuralNetwork(Optimizers.Sgd(1e-3), NeuralNetwork.Precision(np.float32, np.float16))
+        net.data_layer = self.Confident()
+        net.loss_layer = Loss.CrossEntropyLoss()
+        for layer in (FullyConnected.FullyConnected(3, 3), ReLU.ReLU(), FullyConnected.FullyConnected(3, 3),
+                      SoftMax.SoftMax()):
+            net.append_layer(layer)
+        for i in (0, 2):
+            np.copyto(net.layers[i].weights, np.vstack([np.eye(3), np.zeros(3)]))
+        net.train(2)
+        self.assertTrue(np.all(np.isfinite(net.loss)))
+        prediction = net.test(np.array([[30., 0., 0.]]))
+        self.assertEqual(prediction.dtype, np.float32)
+        self.assertEqual(net.layers[3].output.dtype, np.float32)
+
+    def test_loss_scale(self):
+        # Weight gradients do not depend on the loss scale
+        gradients = []
+        for loss_scale in (1., 1024.):
+            net = self._network(NeuralNetwork.Precision(np.float32, loss_scale=loss_scale))
+            net.train(1)
+            gradients.append(net.layers[0].gradient_weights.copy())
+        np.testing.assert_allclose(gradients[0], gradients[1], rtol=1e-5)
+
+    def test_dynamic_loss_scale(self):
+        # An overflowing step is skipped and halves the scale
+        precision = NeuralNetwork.Precision(np.float32, np.float16, loss_scale=2.**40, dynamic_loss_scale=True)
+        net = self._network(precision)
+        weights = [net.layers[0].weights.copy(), net.layers[2].weights.copy()]
+        net.train(1)
+        # No layer applies its update, also not those that ran backward before the overflow was found
+        np.testing.assert_array_equal(net.layers[0].weights, weights[0])
+        np.testing.assert_array_equal(net.layers[2].weights, weights[1])
+        self.assertEqual(precision.loss_scale, 2.**39)
+        self.assertEqual(precision.skipped_steps, 1)
+
+
+class TestReLUModes(unittest.TestCase):
+
+    def test_modes(self):
+        # All modes compute the same values, the mask is the only state kept for backward
+        input_tensor = np.random.randn(6, 11)
+        error_tensor = np.random.randn(6, 11)
+        reference = ReLU.ReLU()
+        expected_output = reference.forward(input_tensor.copy())
+        expected_error = reference.backward(error_tensor.copy())
+        self.assertEqual(reference.mask.dtype, bool)
+        for layer in (ReLU.ReLU(inplace=True), ReLU.ReLU(packed_mask=True), ReLU.ReLU(True, True)):
+            np.testing.assert_array_equal(layer.forward(input_tensor.copy()), expected_output)
+            np.testing.assert_array_equal(layer.backward(error_tensor.copy()), expected_error)
+
+    def test_inplace(self):
+        layer = ReLU.ReLU(inplace=True)
+        input_tensor = np.random.randn(4, 5).astype(np.float32)
+        error_tensor = np.ones((4, 5), dtype=np.float32)
+        self.assertIs(layer.forward(input_tensor), input_tensor)
+        mask = layer.mask
+        self.assertIs(layer.backward(error_tensor), error_tensor)
+        self.assertEqual(error_tensor.dtype, np.float32)
+        np.testing.assert_array_equal(error_tensor, input_tensor > 0)
+        # The mask buffer is reused while the shape stays the same
+        layer.forward(np.random.randn(4, 5))
+        self.assertIs(layer.mask, mask)
+
+
+class TestSoftMaxCrossEntropy(unittest.TestCase):
+    def setUp(self):
+        self.label_tensor = np.eye(4)[np.random.randint(0, 4, 9)]
+
+    def test_matches_separate_layers(self):
+        input_tensor = np.random.randn(9, 4) * 5
+        softmax, cross_entropy = SoftMax.SoftMax(), Loss.CrossEntropyLoss()
+        expected_loss = cross_entropy.forward(softmax.forward(input_tensor), self.label_tensor)
+        expected_error = softmax.backward(cross_entropy.backward(self.label_tensor))
+
+        fused = Loss.SoftMaxCrossEntropyLoss()
+        self.assertAlmostEqual(fused.forward(input_tensor, self.label_tensor), expected_loss, places=6)
+        np.testing.assert_allclose(fused.backward(self.label_tensor), expected_error, atol=1e-8)
+        np.testing.assert_allclose(fused.predict(input_tensor), softmax.forward(input_tensor))
+
+    def test_extreme_scores(self):
+        # No overflow, no log(0) and no division for scores far apart
+        input_tensor = (1 - self.label_tensor) * 1e4
+        fused = Loss.SoftMaxCrossEntropyLoss()
+        self.assertAlmostEqual(fused.forward(input_tensor, self.label_tensor), 9 * (1e4 + np.log(3)), places=6)
+        np.testing.assert_allclose(fused.backward(self.label_tensor), (1 - self.label_tensor) / 3 - self.label_tensor)
+
+    def test_gradient(self):
+        layers = [FullyConnected.FullyConnected(3, 4), Loss.SoftMaxCrossEntropyLoss()]
+        difference = Helpers.gradient_check(layers, np.random.rand(9, 3), self.label_tensor)
+        self.assertLessEqual(np.sum(difference), 1e-5)
+
+    def test_rows_independent(self):
+        # Every sample is normalised on its own, independent of the rest of the batch
+        softmax = SoftMax.SoftMax()
+        input_tensor = np.random.randn(9, 4)
+        single = softmax.forward(input_tensor[:1].copy())
+        np.testing.assert_allclose(softmax.forward(input_tensor)[:1], single)
+        np.testing.assert_allclose(softmax.forward(input_tensor).sum(axis=1), np.ones(9))
+
+
+class TestSparseLabels(unittest.TestCase):
+    def setUp(self):
+        self.labels = np.random.randint(0, 4, 9).astype(np.int32)
+        self.label_tensor = np.eye(4)[self.labels]
+
+    def test_cross_entropy(self):
+        # Integer labels give the same loss and gradient as their one-hot encoding
+        prediction_tensor = SoftMax.SoftMax().forward(np.random.randn(9, 4))
+        dense, sparse = Loss.CrossEntropyLoss(), Loss.CrossEntropyLoss()
+        self.assertAlmostEqual(sparse.forward(prediction_tensor, self.labels),
+                               dense.forward(prediction_tensor, self.label_tensor))
+        np.testing.assert_allclose(sparse.backward(self.labels), dense.backward(self.label_tensor))
+
+    def test_softmax_cross_entropy(self):
+        input_tensor = np.random.randn(9, 4) * 5
+        dense, sparse = Loss.SoftMaxCrossEntropyLoss(), Loss.SoftMaxCrossEntropyLoss()
+        self.assertAlmostEqual(sparse.forward(input_tensor, self.labels), dense.forward(input_tensor, self.label_tensor))
+        np.testing.assert_allclose(sparse.backward(self.labels), dense.backward(self.label_tensor))
+
+    def test_data_layers(self):
+        input_tensor, labels = Helpers.RandomData(4, 16, 3, sparse_labels=True).next()
+        self.assertEqual(labels.shape, (16,))
+        self.assertEqual(labels.dtype, np.int32)
+        iris = Helpers.IrisData(50, sparse_labels=True)
+        input_tensor, labels = iris.next()
+        self.assertEqual(labels.shape, (50,))
+        self.assertEqual(labels.dtype, np.int32)
+        self.assertEqual(iris.get_test_set()[1].ndim, 1)
+
+    def test_iris_training(self):
+        net = NeuralNetwork.NeuralNetwork(Optimizers.Sgd(1e-2))
+        net.data_layer = Helpers.IrisData(50, sparse_labels=True)
+        net.loss_layer = Loss.SoftMaxCrossEntropyLoss()
+        net.append_layer(FullyConnected.FullyConnected(4, 3))
+        net.train(1000)
+        data, labels = net.data_layer.get_test_set()
+        accuracy = np.mean(np.argmax(net.test(data), axis=1) == labels)
+        self.assertGreater(accuracy, 0.8)
+
+
 class L2Loss:
     def __init__(self):
         self.input_tensor = None
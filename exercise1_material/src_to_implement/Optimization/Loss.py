@@ -1,40 +1,107 @@
 import numpy as np
 
+# Added to the predictions to avoid log(0) and division by 0, a python float so that float32 inputs stay float32
+EPSILON = float(np.finfo(float).eps)
+
+def _class_indices(label_tensor):
+    # Sparse labels (one class index per sample) as a column for np.take_along_axis, None for one-hot labels
+    label_tensor = np.asarray(label_tensor)
+    if label_tensor.ndim != 1:
+        return None
+    return label_tensor.astype(np.intp, copy=False)[:, None]
+
 class CrossEntropyLoss:
     def __init__(self):
         """
         Initialize the CrossEntropyLoss.
         """
         self.predictions = None
-        self.targets = None
 
     def forward(self, prediction_tensor, label_tensor):
         """
         Compute the forward pass of the loss function.
         :param prediction_tensor: Predicted probabilities (output of the model).
-        :param label_tensor: True labels (one-hot encoded).
+        :param label_tensor: True labels, one-hot encoded or as integer class indices.
         :return: Computed loss value.
         """
-        # Add a small epsilon to avoid log(0)
-        epsilon = 1e-15  # More standard value
-        # Ensure prediction values are positive (between epsilon and 1)
-        prediction_tensor = np.clip(prediction_tensor, epsilon, 1 - epsilon)
-        
-        # Store tensors for backward pass
+        # Store the predictions for the backward pass
         self.predictions = prediction_tensor
-        self.targets = label_tensor
-        
-        # Calculate -y*log(y')
-        loss = -np.sum(label_tensor * np.log(prediction_tensor))
-        
-        return loss
 
-    def backward(self, label_tensor=None):
+        # Sparse labels: only the probabilities of the true classes contribute
+        indices = _class_indices(label_tensor)
+        if indices is not None:
+            return -np.sum(np.log(np.take_along_axis(prediction_tensor, indices, axis=1) + EPSILON))
+
+        # Calculate -y*log(y' + eps), eps avoids log(0)
+        return -np.sum(label_tensor * np.log(prediction_tensor + EPSILON))
+
+    def backward(self, label_tensor):
         """
         Compute the backward pass of the loss function.
-        :param label_tensor: Optional label tensor (ignored, using stored targets)
+        :param label_tensor: True labels, one-hot encoded or as integer class indices.
         :return: Gradient of the loss with respect to predictions.
         """
-        # Gradient is -y/y'
-        grad = -self.targets / self.predictions
-        return grad
\ No newline at end of file
+        # Sparse labels: the gradient is only nonzero at the true classes
+        indices = _class_indices(label_tensor)
+        if indices is not None:
+            gradient = np.zeros_like(self.predictions)
+            true_class = np.take_along_axis(self.predictions, indices, axis=1)
+            np.put_along_axis(gradient, indices, -1 / (true_class + EPSILON), axis=1)
+            return gradient
+
+        # Gradient is -y/(y' + eps)
+        return -label_tensor / (self.predictions + EPSILON)
+
+class SoftMaxCrossEntropyLoss:
+    def __init__(self):
+        """
+        Initialize the fused SoftMax and CrossEntropyLoss, which takes the scores (logits) of the last layer
+        directly instead of the output of a SoftMax layer.
+        """
+        self.probabilities = None
+
+    def predict(self, input_tensor):
+        """
+        Compute the class probabilities, i.e. the output the SoftMax layer would have.
+        :param input_tensor: Scores of shape (batch, categories).
+        :return: Probabilities of shape (batch, categories).
+        """
+        probabilities = input_tensor - np.max(input_tensor, axis=1, keepdims=True)
+        np.exp(probabilities, out=probabilities)
+        probabilities /= np.sum(probabilities, axis=1, keepdims=True)
+        return probabilities
+
+    def forward(self, input_tensor, label_tensor):
+        """
+        Compute the cross entropy of the softmax of the scores by log-sum-exp, without dividing or taking log(0).
+        :param input_tensor: Scores of shape (batch, categories).
+        :param label_tensor: True labels, one-hot encoded or as integer class indices.
+        :return: Computed loss value.
+        """
+        # log softmax = shifted - log(sum(exp(shifted))), the exponentials are kept as the probabilities
+        shifted = input_tensor - np.max(input_tensor, axis=1, keepdims=True)
+        probabilities = np.exp(shifted)
+        sums = np.sum(probabilities, axis=1, keepdims=True)
+        probabilities /= sums
+        self.probabilities = probabilities
+
+        # -sum(y * log p) = sum(y * (log(sum) - shifted)) for every row, for sparse labels at the true class only
+        indices = _class_indices(label_tensor)
+        if indices is not None:
+            return float(np.sum(np.log(sums) - np.take_along_axis(shifted, indices, axis=1)))
+        return float(np.sum(label_tensor * (np.log(sums) - shifted)))
+
+    def backward(self, label_tensor):
+        """
+        Compute the gradient of the loss with respect to the scores.
+        :param label_tensor: True labels, one-hot encoded or as integer class indices.
+        :return: p - y, written into the probability buffer of the forward pass.
+        """
+        gradient = self.probabilities
+        indices = _class_indices(label_tensor)
+        if indices is not None:
+            gradient[np.arange(len(gradient)), indices[:, 0]] -= 1
+        else:
+            gradient -= label_tensor
+        self.probabilities = None
+        return gradient
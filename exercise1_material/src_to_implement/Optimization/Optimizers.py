@@ -1,20 +1,18 @@
 import numpy as np
 
-class sgd:
-    def __init__(self, learning_rate=0.01):
+class Sgd:
+    def __init__(self, learning_rate):
         """
         Initialize the SGD optimizer.
         :param learning_rate: Learning rate for the optimizer.
         """
         self.learning_rate = learning_rate
 
-    def step(self, layer):
+    def calculate_update(self, weight_tensor, gradient_tensor):
         """
         Perform a single optimization step.
-        :param layer: The layer to optimize.
+        :param weight_tensor: Current weights.
+        :param gradient_tensor: Gradient of the loss with respect to the weights.
+        :return: Updated weights.
         """
-        if not layer.trainable:
-            return
-
-        # Update weights
-        layer.weights -= self.learning_rate * layer.grad_weights
\ No newline at end of file
+        return weight_tensor - self.learning_rate * gradient_tensor